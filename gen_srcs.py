@@ -1,10 +1,72 @@
 #!/usr/bin/env python3
 # Generate C source files
 
-import os.path, sys, argparse, shutil
+import os.path, sys, argparse, multiprocessing, hashlib, json, shutil
+import subprocess, time, statistics, contextlib, random, tarfile, tempfile, io
+import collections, threading, queue, math, platform, re
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
 
 version = '0.0.1'
 
+# Profiles of the bodies of the library functions, mixed picks one
+# of the others for each library
+body_profiles = ['printf', 'arith', 'struct', 'switch', 'inline', 'mixed']
+
+# Source extension, compiler and flags of each language and its name in
+# the build systems
+languages = {
+    'c': {'ext': '.c', 'cc': 'cc', 'std': '-std=c99', 'cc_var': 'CC',
+          'flags_var': 'CFLAGS', 'meson': 'c', 'cmake': 'C'},
+    'cpp': {'ext': '.cpp', 'cc': 'c++', 'std': '-std=c++11', 'cc_var': 'CXX',
+            'flags_var': 'CXXFLAGS', 'meson': 'cpp', 'cmake': 'CXX'},
+}
+
+
+def shard_spec(text):
+    '''
+    Parse the I/N argument of --shard
+    '''
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'{0}' must be I/N".format(text))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            "'{0}' must have 0 <= I < N".format(text))
+    return index, count
+
+
+def byte_size(text):
+    '''
+    Parse a number of bytes with an optional K, M, G or T suffix,
+    powers of 1024
+    '''
+    units = 'KMGT'
+    scale = 1
+    if text and text[-1].upper() in units:
+        scale = 1024 ** (units.index(text[-1].upper()) + 1)
+        text = text[:-1]
+    try:
+        size = int(text) * scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "'{0}' must be a number of bytes".format(text))
+    if size < 0:
+        raise argparse.ArgumentTypeError(
+            "'{0}' must be >= 0".format(text))
+    return size
+
+
 parser = argparse.ArgumentParser()
 
 parser.add_argument('-v', '--version',
@@ -13,12 +75,215 @@ parser.add_argument('-v', '--version',
                     default=False,
                     help='Print version.')
 
-parser.add_argument('builder', help='<builder: cmake meson>', nargs=1)
+parser.add_argument('builder', help='<builder: cmake craftr make meson ninja>',
+                    nargs=1)
 parser.add_argument('hierarchy_path', help='<file path>', nargs=1)
 parser.add_argument('library_count', help='<Library count>', nargs=1)
 parser.add_argument('function_count_per_library',
                     help='<function count per library>',
                     nargs=1)
+parser.add_argument('-j', '--jobs',
+                    type=int,
+                    default=1,
+                    help='Number of processes used to create the libraries.')
+parser.add_argument('--writer-threads',
+                    type=int,
+                    default=0,
+                    metavar='N',
+                    help='Write the files with N threads while the next '
+                    'files are rendered, by default they are written as '
+                    'they are rendered.')
+parser.add_argument('--app-shards',
+                    type=int,
+                    default=0,
+                    metavar='K',
+                    help='Split the calls of the test application into K '
+                    'src/drive_<lib>.c files, 0 puts them all in main.c.')
+parser.add_argument('--files-per-library',
+                    type=int,
+                    default=1,
+                    metavar='K',
+                    help='Split the functions of each library across K '
+                    'source files.')
+parser.add_argument('--internal-header',
+                    action='store_true',
+                    default=False,
+                    help='Give each library a private header included by '
+                    'its source files.')
+parser.add_argument('--app-count',
+                    type=int,
+                    default=1,
+                    metavar='N',
+                    help='Number of applications, a single one is named '
+                    'testapp otherwise testapp000 and up.')
+parser.add_argument('--app-select',
+                    choices=['all', 'slice', 'random'],
+                    default='all',
+                    help='How the libraries of each application are chosen, '
+                    'a contiguous slice or a seeded random subset of '
+                    '--app-fraction of the libraries.')
+parser.add_argument('--app-fraction',
+                    type=float,
+                    default=1.0,
+                    help='Fraction of the libraries used by each application '
+                    'for the slice and random selections.')
+parser.add_argument('--topology',
+                    choices=['flat', 'chain', 'tree', 'diamond', 'random'],
+                    default='flat',
+                    help='Dependency graph of the libraries, flat libraries '
+                    'have no dependencies.')
+parser.add_argument('--dep-fanout',
+                    type=int,
+                    default=2,
+                    help='Number of dependencies of each library of the tree '
+                    'topology.')
+parser.add_argument('--max-in-degree',
+                    type=int,
+                    default=3,
+                    help='Maximum number of dependencies of each library of '
+                    'the random topology.')
+parser.add_argument('--fanout',
+                    type=int,
+                    default=0,
+                    help='Nest the library directories in a balanced tree of '
+                    'directories with at most FANOUT entries each, by default '
+                    'every library is directly in libs/.')
+parser.add_argument('--lang',
+                    choices=sorted(languages),
+                    default='c',
+                    help='Language of the generated sources, cpp libraries '
+                    'have class templates instantiated by their functions.')
+parser.add_argument('--include-depth',
+                    type=int,
+                    default=0,
+                    help='Number of nested detail headers included by the '
+                    'header of each library.')
+parser.add_argument('--linkage',
+                    choices=['static', 'shared', 'object'],
+                    default='static',
+                    help='How the libraries are built and linked, shared '
+                    'libraries export their functions with a macro of an '
+                    'include/<lib>_export.h header. Supported by the cmake, '
+                    'craftr and meson builders.')
+parser.add_argument('--unity',
+                    action='store_true',
+                    default=False,
+                    help='Compile the sources of each target as a single '
+                    'translation unit. Supported by the cmake, craftr and '
+                    'meson builders.')
+parser.add_argument('--body',
+                    dest='body_profile',
+                    choices=body_profiles,
+                    default='printf',
+                    help='Profile of the bodies of the library functions, '
+                    'printf only prints the name of the function, mixed '
+                    'picks one of the others for each library.')
+parser.add_argument('--body-size',
+                    type=int,
+                    default=1,
+                    help='Units of work in each function body of the arith, '
+                    'struct, switch and inline profiles.')
+parser.add_argument('--seed',
+                    type=int,
+                    default=0,
+                    help='Seed of everything generated randomly.')
+parser.add_argument('--profile',
+                    nargs='?',
+                    const='-',
+                    default=None,
+                    metavar='PATH',
+                    help='Write the time of each phase and the files, '
+                    'directories and bytes written as JSON to PATH or stdout.')
+parser.add_argument('--db',
+                    default=None,
+                    metavar='PATH',
+                    help='Append the time of each phase of the generator to '
+                    'the SQLite database at PATH.')
+parser.add_argument('--pstats',
+                    default=None,
+                    metavar='PATH',
+                    help='Run the generator under cProfile and dump the '
+                    'statistics to PATH.')
+parser.add_argument('--churn-bodies',
+                    type=float,
+                    default=0.0,
+                    metavar='PERCENT',
+                    help='Change the body of PERCENT of the functions.')
+parser.add_argument('--churn-headers',
+                    type=float,
+                    default=0.0,
+                    metavar='PERCENT',
+                    help='Add a declaration to the header of PERCENT of the '
+                    'libraries.')
+parser.add_argument('--churn-libraries',
+                    type=float,
+                    default=0.0,
+                    metavar='PERCENT',
+                    help='Change the body of every function of PERCENT of '
+                    'the libraries.')
+parser.add_argument('--churn-seed',
+                    type=int,
+                    default=0,
+                    help='Seed of the selection of the changes, each seed is '
+                    'a different variant.')
+parser.add_argument('--churn-report',
+                    default=None,
+                    metavar='PATH',
+                    help='Write the translation units changed by the churn '
+                    'options as JSON to PATH or stdout if PATH is -.')
+parser.add_argument('--shard',
+                    type=shard_spec,
+                    default=None,
+                    metavar='I/N',
+                    help='Write shard I, counting from 0, of N disjoint parts '
+                    'of the hierarchy, the first shard writes the '
+                    'applications and the build files outside of the '
+                    'libraries.')
+parser.add_argument('--verify',
+                    action='store_true',
+                    default=False,
+                    help='Compare the hierarchy on disk, for instance merged '
+                    'from shards, with the generated files instead of writing '
+                    'them and write its manifest if they match.')
+parser.add_argument('--plan',
+                    nargs='?',
+                    const='-',
+                    default=None,
+                    metavar='PATH',
+                    help='Write the number of files, directories and bytes '
+                    'of the hierarchy as JSON to PATH or stdout instead of '
+                    'generating it.')
+parser.add_argument('--max-bytes',
+                    type=byte_size,
+                    default=None,
+                    metavar='SIZE',
+                    help='Refuse to generate a hierarchy of more than SIZE '
+                    'bytes, with an optional K, M, G or T suffix.')
+parser.add_argument('--max-files',
+                    type=int,
+                    default=None,
+                    metavar='N',
+                    help='Refuse to generate a hierarchy of more than N '
+                    'files.')
+parser.add_argument('--archive',
+                    default=None,
+                    metavar='PATH',
+                    help='Write the hierarchy into a tar archive at PATH, or '
+                    'to stdout if PATH is -, instead of the file system.')
+parser.add_argument('--compression',
+                    choices=['none', 'gz', 'bz2', 'xz'],
+                    default=None,
+                    help='Compression of the archive, the default is chosen '
+                    'by the extension of PATH.')
+parser.add_argument('--fsync',
+                    action='store_true',
+                    default=False,
+                    help='fsync every file and directory written, by default '
+                    'nothing is synced.')
+parser.add_argument('--force',
+                    action='store_true',
+                    default=False,
+                    help='Rewrite every file even if it is unchanged.')
 
 
 class Header:
@@ -31,6 +296,8 @@ class Header:
     includes = None
     sys_includes = None
     func_declarations = None
+    functions = None
+    definitions = None
 
     # Initializer
     def __init__(self,
@@ -39,13 +306,17 @@ class Header:
                  includes=None,
                  sys_includes=None,
                  type_declarations=None,
-                 func_declarations=None):
+                 func_declarations=None,
+                 functions=None,
+                 definitions=None):
         self.file_path = file_path
         self.comments = comments if comments else []
         self.includes = includes if includes else []
         self.sys_includes = sys_includes if sys_includes else []
         self.type_declarations = type_declarations if type_declarations else []
         self.func_declarations = func_declarations if func_declarations else []
+        self.functions = functions
+        self.definitions = definitions if definitions else []
 
     def get_name(self):
         return os.path.basename(self.file_path)
@@ -56,7 +327,10 @@ class Header:
     def append_type_declaration(self, type_declaration):
         self.type_declarations.append(func)
 
-    def write(self, f):
+    def render(self):
+        '''
+        Return the contents of the header as a string
+        '''
         path = os.path.abspath(self.file_path)
         parts = []
         while True:
@@ -72,33 +346,69 @@ class Header:
         conditional_name += '_'
         conditional_name = conditional_name.replace('.', '_')
 
+        out = []
         for line in self.comments:
-            print('// {0}'.format(line), file=f)
-        print('', file=f)
-        print('#ifndef  {0}'.format(conditional_name), file=f)
-        print('#define {0}'.format(conditional_name), file=f)
-        print('', file=f)
+            out.append('// {0}\n'.format(line))
+        out.append('\n')
+        out.append('#ifndef  {0}\n'.format(conditional_name))
+        out.append('#define {0}\n'.format(conditional_name))
+        out.append('\n')
         if self.includes:
             for line in self.includes:
-                print('#include "{0}"'.format(line), file=f)
-            print('', file=f)
+                out.append('#include "{0}"\n'.format(line))
+            out.append('\n')
 
         if self.sys_includes:
             for line in self.sys_includes:
-                print('#include <{0}>'.format(line), file=f)
-            print('', file=f)
+                out.append('#include <{0}>\n'.format(line))
+            out.append('\n')
 
         if self.type_declarations:
             for line in self.type_declarations:
-                print('{0};'.format(line), file=f)
-            print('', file=f)
+                out.append('{0};\n'.format(line))
+            out.append('\n')
 
-        if self.func_declarations:
+        if self.func_declarations or self.functions:
             for line in self.func_declarations:
-                print('{0};'.format(line), file=f)
-            print('', file=f)
+                out.append('{0};\n'.format(line))
+            if self.functions:
+                for line in self.functions.signatures():
+                    out.append('{0};\n'.format(line))
+            out.append('\n')
+
+        if self.functions:
+            for definition in self.functions.inline_definitions():
+                out.append(definition)
+                out.append('\n')
 
-        print('#endif // {0}'.format(conditional_name), file=f)
+        for definition in self.definitions:
+            out.append(definition)
+            out.append('\n')
+
+        out.append('#endif // {0}\n'.format(conditional_name))
+        return ''.join(out)
+
+    def size(self):
+        '''
+        Return the length of render() in bytes without rendering the
+        declarations and inline definitions of the functions one by one
+        '''
+        bare = Header(self.file_path, self.comments, self.includes,
+                      self.sys_includes, self.type_declarations,
+                      self.func_declarations, definitions=self.definitions)
+        size = len(bare.render().encode())
+        functions = self.functions
+        if functions:
+            if not self.func_declarations:
+                size += 1
+            size += functions.size(FunctionRange.func_sig) + 2 * len(functions)
+            if functions.profile == 'inline':
+                size += (functions.size(FunctionRange.inline_definition) +
+                         len(functions))
+        return size
+
+    def write(self, f):
+        f.write(self.render())
 
 
 class Function:
@@ -148,21 +458,272 @@ class Function:
         s += ')'
         return s
 
-    def write(self, f):
+    def render(self):
+        '''
+        Return the definition of the function as a string
+        '''
+        out = []
         for line in self.comments:
-            print('// {0}'.format(line), file=f)
-        signature = '{0} {{'.format(self.func_sig())
-        print(signature, file=f)
+            out.append('// {0}\n'.format(line))
+        out.append('{0} {{\n'.format(self.func_sig()))
         if self.local_declarations:
             for line in self.local_declarations:
-                print('    {0};'.format(line), file=f)
-            print('')
+                out.append('    {0};\n'.format(line))
+            out.append('\n')
 
         if self.body:
             for line in self.body:
-                print('    {0};'.format(line), file=f)
+                out.append('    {0};\n'.format(line))
+
+        out.append('}\n')
+        return ''.join(out)
+
+    def write(self, f):
+        f.write(self.render())
+
+
+class FunctionRange:
+    '''
+    The functions of a library, func<i> for each i in func_range.
+    Nothing is stored per function, names, signatures and definitions
+    are computed on demand so the range can be iterated any number
+    of times. calls maps the index of a function to the names of the
+    functions it calls and edits maps the index of a function to the
+    id of the edit of its body, these are rendered with a Function.
+
+    profile selects the body of the functions, printf only prints the
+    name of the function, the others compute a value with body_size
+    times their unit of work: arith loops over arithmetic, struct
+    fills and sums an array of structs, switch runs a switch table
+    and inline calls a static inline helper defined in the header.
+    The constants are derived from seed and always have 8 hex digits
+    so the size of a function doesn't depend on the seed.
+
+    With a templates prefix the functions are C++ and each instantiates
+    the <prefix>_value class template of its library. With an api
+    macro the declarations are prefixed by it, to export them from a
+    shared library.
+    '''
+    __slots__ = ('func_range', 'calls', 'edits', 'profile', 'body_size',
+                 'seed', 'templates', 'api')
+
+    # Length of the rendering of a function of each group of groups()
+    # by the profile, body size and length of the templates prefix
+    __sizes = {}
+
+    # Definition of func<i>, the same as rendered by Function
+    DEFINITION = ('// func{0}\n'
+                  'void func{0}(void) {{\n'
+                  '    printf("func{0}\\n");\n'
+                  '}}\n')
+
+    # Number of fields of the struct profile and cases of a switch
+    STRUCT_FIELDS = 8
+    SWITCH_CASES = 8
+
+    # Types and folding depths the C++ functions instantiate templates
+    # with, the combinations repeat across the functions of a library
+    TEMPLATE_TYPES = ['unsigned int', 'unsigned long', 'unsigned short',
+                      'unsigned char']
+    TEMPLATE_DEPTH = 16
+
+    # Initializer
+    def __init__(self, func_range=range(0, 1), calls=None, edits=None,
+                 profile='printf', body_size=1, seed=0, templates=None,
+                 api=None):
+        self.func_range = func_range
+        self.calls = calls if calls else {}
+        self.edits = edits if edits else {}
+        self.profile = profile
+        self.body_size = max(1, int(body_size))
+        self.seed = seed
+        self.templates = templates
+        self.api = api
+
+    def __len__(self):
+        return len(self.func_range)
+
+    def __iter__(self):
+        return iter(self.func_range)
+
+    def getName(self, i):
+        return 'func{0}'.format(i)
+
+    def func_sig(self, i):
+        if self.api:
+            return '{0} void func{1}(void)'.format(self.api, i)
+        return 'void func{0}(void)'.format(i)
+
+    def names(self):
+        for i in self.func_range:
+            yield 'func{0}'.format(i)
+
+    def signatures(self):
+        if self.api:
+            for i in self.func_range:
+                yield '{0} void func{1}(void)'.format(self.api, i)
+            return
+        for i in self.func_range:
+            yield 'void func{0}(void)'.format(i)
+
+    def split(self, count):
+        '''
+        Return the functions split into *count* contiguous ranges
+        '''
+        total = len(self.func_range)
+        return [FunctionRange(self.func_range[k * total // count:
+                                              (k + 1) * total // count],
+                              self.calls, self.edits, self.profile,
+                              self.body_size, self.seed, self.templates,
+                              self.api)
+                for k in range(0, count)]
+
+    def constant(self, i, k):
+        '''
+        Return the constant *k* of func<i> as a C literal
+        '''
+        x = (i * 0x9e3779b1 + k * 0x85ebca77 + self.seed * 0xc2b2ae3d)
+        x = (x ^ (x >> 15)) * 0x2c1b3c6d & 0xffffffff
+        x ^= x >> 12
+        return '0x{0:08x}u'.format(x)
+
+    def groups(self):
+        '''
+        Yield the first index and the number of functions of each group
+        of the range whose names, signatures and definitions have the
+        same length: the indices with the same number of digits and, in
+        C++, the same template arguments, which repeat every
+        TEMPLATE_DEPTH indices.
+        '''
+        period = self.TEMPLATE_DEPTH if self.templates else 1
+        start, stop = self.func_range.start, self.func_range.stop
+        low, high = 0, 10
+        while low < stop:
+            first, last = max(start, low), min(stop, high)
+            for r in range(0, period):
+                i = first + (r - first) % period
+                if i < last:
+                    yield i, (last - 1 - i) // period + 1
+            low, high = high, high * 10
+
+    def size(self, render):
+        '''
+        Return the total length of render(functions, i) over the range
+        by rendering one function of each of groups(), the functions
+        with calls or edits are rendered one by one.
+        '''
+        plain = FunctionRange(self.func_range, profile=self.profile,
+                              body_size=self.body_size, seed=self.seed,
+                              templates=self.templates, api=self.api)
+        period = self.TEMPLATE_DEPTH if self.templates else 1
+        shape = (render, self.profile, self.body_size,
+                 len(self.templates) if self.templates else None,
+                 len(self.api) if self.api else None)
+        size = 0
+        for i, count in plain.groups():
+            key = shape + (len(str(i)), i % period)
+            if key not in self.__sizes:
+                self.__sizes[key] = len(render(plain, i))
+            size += count * self.__sizes[key]
+        for i in set(self.calls) | set(self.edits):
+            if i in self.func_range:
+                size += len(render(self, i)) - len(render(plain, i))
+        return size
+
+    def inline_definition(self, i):
+        '''
+        Return the definition of the static inline helper of func<i>
+        '''
+        return ('static inline unsigned int func{0}_step(unsigned int x) {{\n'
+                '    return (x ^ (x >> 7)) * {1} + {2};\n'
+                '}}\n'.format(i, self.constant(i, 0), self.constant(i, 1)))
+
+    def inline_definitions(self):
+        '''
+        Yield the definitions of the static inline helpers of the
+        functions, only the inline profile has them.
+        '''
+        if self.profile != 'inline':
+            return
+        for i in self.func_range:
+            yield self.inline_definition(i)
 
-        print('}', file=f)
+    def body(self, i, label):
+        '''
+        Return the local declarations and the statements of the body
+        of func<i> which prints *label*.
+        '''
+        n = self.body_size
+        c = self.constant
+        if self.profile == 'arith':
+            local = ['unsigned int acc = {0}'.format(c(i, 0)), 'int k']
+            body = ['for (k = 0; k < 16; ++k) '
+                    'acc = (acc ^ (acc >> 13)) * {0} + (unsigned int)k'.format(
+                        c(i, j + 1)) for j in range(0, n)]
+            result = 'acc'
+        elif self.profile == 'struct':
+            fields = ['f{0}'.format(m) for m in range(0, self.STRUCT_FIELDS)]
+            local = ['struct {{ unsigned int {0}; }} s[{1}]'.format(
+                         ', '.join(fields), n),
+                     'unsigned int sum = 0', 'int k']
+            body = ['s[{0}].{1} = {2}'.format(j, field,
+                                              c(i, j * len(fields) + m))
+                    for j in range(0, n) for m, field in enumerate(fields)]
+            body.append('for (k = 0; k < {0}; ++k) sum += s[k].f0 * s[k].{1} + '
+                        '(s[k].f1 ^ s[k].f2)'.format(n, fields[-1]))
+            result = 'sum'
+        elif self.profile == 'switch':
+            cases = self.SWITCH_CASES * n
+            ops = ['+=', '^=', '-=', '|=']
+            table = ''.join('case {0}: acc {1} {2}; break; '.format(
+                                j, ops[j % len(ops)], c(i, j + 1))
+                            for j in range(0, cases))
+            local = ['unsigned int acc = {0}'.format(c(i, 0)),
+                     'unsigned int k']
+            body = ['for (k = 0; k < {0}u; ++k) switch ((acc + k) % {0}u) '
+                    '{{ {1}default: break; }}'.format(cases, table)]
+            result = 'acc'
+        elif self.profile == 'inline':
+            local = ['unsigned int acc = {0}'.format(c(i, 2))]
+            body = ['acc = func{0}_step(acc + {1})'.format(i, c(i, j + 3))
+                    for j in range(0, n)]
+            result = 'acc'
+        else:
+            return [], ['printf("{0}\\n")'.format(label)]
+        body.append('printf("{0} %u\\n", {1})'.format(label, result))
+        return local, body
+
+    def render(self, i):
+        if (self.profile == 'printf' and not self.templates and
+                i not in self.calls and i not in self.edits):
+            return self.DEFINITION.format(i)
+
+        func_name = self.getName(i)
+        if i in self.edits:
+            label = '{0} edit {1}'.format(func_name, self.edits[i])
+        else:
+            label = func_name
+        local, body = self.body(i, label)
+        if self.templates:
+            types = self.TEMPLATE_TYPES
+            local = ['{0}_value<{1}> value({2})'.format(
+                self.templates, types[i % len(types)],
+                self.constant(i, 0))] + local
+            body = ['(void)value.mix<{0}>()'.format(
+                i % self.TEMPLATE_DEPTH + 1)] + body
+        if i not in self.calls:
+            return Function(comments=[func_name], name=func_name,
+                            local_declarations=local, body=body).render()
+
+        # The static guard keeps the calls of a dependency graph from
+        # growing exponentially when the test application runs
+        body.extend(['if (visited) return', 'visited = 1'])
+        for callee in self.calls[i]:
+            body.append('{0}()'.format(callee))
+        return Function(comments=[func_name],
+                        name=func_name,
+                        local_declarations=local + ['static int visited'],
+                        body=body).render()
 
 
 class LibrarySrc:
@@ -175,71 +736,78 @@ class LibrarySrc:
     includes = None
     sys_includes = None
     type_declarations = None
-    header = None
-    func_range = range(0, 1)
     functions = None
 
     # Initializer
     def __init__(self,
                  file_path='',
-                 func_range=range(0, 1),
+                 functions=None,
                  comments=None,
                  includes=None,
                  sys_includes=None,
-                 type_declarations=None,
-                 header=None):
+                 type_declarations=None):
         self.file_path = file_path
-        self.func_range = func_range
+        if functions is None:
+            functions = FunctionRange()
+        self.functions = functions
         self.comments = comments if comments else []
         self.includes = includes if includes else []
         self.sys_includes = sys_includes if sys_includes else []
         self.type_declarations = type_declarations if type_declarations else []
 
-        self.header = header
-        self.functions = []
-
-    def __append_func(self, func):
-        self.header.append_func_declaration(func.func_sig())
-        self.functions.append(func)
-
     def getFunctions(self):
         return self.functions
 
-    def write(self, f):
-        for i in self.func_range:
-            func_name = 'func{0}'.format(i)
-            func = Function(
-                comments=['{0}'.format(func_name)],
-                rettype='void',
-                name=func_name,
-                params=[],
-                body=['printf("{0}\\n")'.format(func_name)])
-            self.__append_func(func)
-
+    def render(self):
+        '''
+        Return the contents of the source file as a string
+        '''
+        out = []
         for line in self.comments:
-            print('// {0}'.format(line), file=f)
-        print('', file=f)
+            out.append('// {0}\n'.format(line))
+        out.append('\n')
         if self.includes:
             for line in self.includes:
-                print('#include "{0}"'.format(line), file=f)
-            print('', file=f)
+                out.append('#include "{0}"\n'.format(line))
+            out.append('\n')
 
         if self.sys_includes:
             for line in self.sys_includes:
-                print('#include <{0}>'.format(line), file=f)
-            print('', file=f)
+                out.append('#include <{0}>\n'.format(line))
+            out.append('\n')
 
         if self.type_declarations:
             for line in self.type_declarations:
-                print('{0};'.format(line), file=f)
-                print('', file=f)
-            print('', file=f)
+                out.append('{0};\n'.format(line))
+                out.append('\n')
+            out.append('\n')
 
         if self.functions:
-            for func in self.functions:
-                func.write(f)
-                print('', file=f)
-            print('', file=f)
+            for i in self.functions:
+                out.append(self.functions.render(i))
+                out.append('\n')
+            out.append('\n')
+        return ''.join(out)
+
+    def size(self):
+        '''
+        Return the length of render() in bytes without rendering the
+        functions one by one
+        '''
+        bare = LibrarySrc(self.file_path, comments=self.comments,
+                          includes=self.includes,
+                          sys_includes=self.sys_includes,
+                          type_declarations=self.type_declarations)
+        bare.functions = None
+        size = len(bare.render().encode())
+        functions = self.functions
+        if functions:
+            size += (functions.size(FunctionRange.render) +
+                     len(functions) + 1)
+        return size
+
+    def write(self, f):
+        f.write(self.render())
 
 
 class Library:
@@ -249,15 +817,67 @@ class Library:
     # Public fields
     lib_path = None
     func_range = None
-    __lib_header = None
-    __lib_source = None
+    file_count = 1
+    internal_header = False
+    type_declarations = None
+    lang = 'c'
+    include_depth = 0
+    linkage = 'static'
+    __dependencies = None
+    __functions = None
 
     # Initializer
-    def __init__(self, path='', func_range=range(0, 1)):
+    def __init__(self, path='', func_range=range(0, 1), dependencies=None,
+                 file_count=1, internal_header=False, func_edits=None,
+                 type_declarations=None, body_profile='printf', body_size=1,
+                 seed=0, lang='c', include_depth=0, linkage='static'):
         self.lib_path = path
         self.func_range = func_range
-        self.__lib_header = None
-        self.__lib_source = None
+        self.file_count = max(1, min(file_count, len(func_range)))
+        self.internal_header = internal_header
+        self.lang = lang
+        self.include_depth = include_depth
+        self.linkage = linkage
+        self.type_declarations = type_declarations if type_declarations else []
+        self.__dependencies = dependencies if dependencies else []
+
+        # The last function calls the first function of each dependency
+        calls = {}
+        if func_range:
+            callees = [dep.getFunctions().getName(dep.func_range[0])
+                       for dep in self.__dependencies if dep.func_range]
+            if callees:
+                calls[func_range[-1]] = callees
+        edits = {}
+        if func_edits:
+            edits = {i: edit_id for i, edit_id in func_edits.items()
+                     if i in func_range}
+        if body_profile == 'mixed':
+            # Pick the profile of the library from its first function
+            profiles = body_profiles[1:-1]
+            pick = random.Random(seed * 1000003 + func_range.start)
+            body_profile = profiles[pick.randrange(len(profiles))]
+        templates = self.getLibName() if lang == 'cpp' else None
+        api = self.getApiMacro() if linkage == 'shared' else None
+        self.__functions = FunctionRange(func_range, calls, edits,
+                                         profile=body_profile,
+                                         body_size=body_size, seed=seed,
+                                         templates=templates, api=api)
+
+    def __getstate__(self):
+        # Pickle the dependencies without their own dependencies so a
+        # deep graph doesn't exceed the recursion limit of pickle
+        state = dict(self.__dict__)
+        state['_Library__dependencies'] = [
+            Library(dep.lib_path, dep.func_range)
+            for dep in self.__dependencies]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def getDependencies(self):
+        return self.__dependencies
 
     def getLibPath(self):
         return self.lib_path
@@ -266,44 +886,204 @@ class Library:
         return os.path.basename(self.lib_path)
 
     def getLibHeaderName(self):
-        return os.path.basename(self.__lib_header.get_name())
+        return self.getLibName() + '.h'
+
+    def getApiMacro(self):
+        return self.getLibName() + '_API'
+
+    def getBuildMacro(self):
+        '''
+        Return the macro defined when the sources of a shared library
+        are compiled, its functions are exported instead of imported
+        '''
+        return self.getLibName() + '_BUILD'
 
     def getFunctions(self):
-        return self.__lib_source.getFunctions()
+        return self.__functions
 
-    def create(self):
+    def getSources(self):
         '''
-        Create a library with the name of defined by the basename(lib_path)
-        it will include a src/ and an include/ directory.
+        Return the source files of the library relative to its path,
+        the functions are split across file_count files.
         '''
         lib_name = self.getLibName()
-        os.makedirs(self.lib_path, exist_ok=True)
+        ext = languages[self.lang]['ext']
+        if self.file_count == 1:
+            return ['src/{0}{1}'.format(lib_name, ext)]
+        return ['src/{0}_{1}{2}'.format(lib_name, k, ext)
+                for k in range(0, self.file_count)]
 
-        header_path = self.lib_path + '/include/' + lib_name + '.h'
-        os.makedirs(os.path.dirname(header_path), exist_ok=True)
-        h = open(header_path, 'w')
+    def getSourceFunctions(self):
+        '''
+        Return the source files of the library with the functions
+        defined in each
+        '''
+        return list(zip(self.getSources(),
+                        self.__functions.split(self.file_count)))
 
-        src_path = self.lib_path + '/src/' + lib_name + '.c'
-        os.makedirs(os.path.dirname(src_path), exist_ok=True)
-        f = open(src_path, 'w')
+    def __render_templates(self):
+        '''
+        Return the class templates of the C++ library header, mix<N>()
+        instantiates a recursive fold N levels deep.
+        '''
+        lib_name = self.getLibName()
+        detail = 'x'
+        if self.include_depth:
+            detail = '{0}_detail0<unsigned int>::apply(x)'.format(lib_name)
+        return [
+            'template <int N>\n'
+            'struct {0}_fold {{\n'
+            '    static unsigned int apply(unsigned int x) {{\n'
+            '        return {0}_fold<N - 1>::apply(x * 31u + N);\n'
+            '    }}\n'
+            '}};\n'
+            '\n'
+            'template <>\n'
+            'struct {0}_fold<0> {{\n'
+            '    static unsigned int apply(unsigned int x) {{\n'
+            '        return {1};\n'
+            '    }}\n'
+            '}};\n'.format(lib_name, detail),
+            'template <typename T>\n'
+            'class {0}_value {{\n'
+            'public:\n'
+            '    explicit {0}_value(unsigned int v) : v_(static_cast<T>(v)) {{}}\n'
+            '\n'
+            '    template <int N>\n'
+            '    T mix() const {{\n'
+            '        return static_cast<T>({0}_fold<N>::apply(v_)) ^ v_;\n'
+            '    }}\n'
+            '\n'
+            'private:\n'
+            '    T v_;\n'
+            '}};\n'.format(lib_name)]
+
+    def __export_header(self):
+        '''
+        Return the header defining the api macro of a shared library,
+        it exports the functions when the library is built and imports
+        them otherwise.
+        '''
+        lib_name = self.getLibName()
+        return Header(
+            file_path=self.lib_path + '/include/' + lib_name + '_export.h',
+            comments=['Export macros of {0}'.format(lib_name)],
+            definitions=['#if defined(_WIN32) || defined(__CYGWIN__)\n'
+                         '#  ifdef {0}\n'
+                         '#    define {1} __declspec(dllexport)\n'
+                         '#  else\n'
+                         '#    define {1} __declspec(dllimport)\n'
+                         '#  endif\n'
+                         '#else\n'
+                         '#  define {1} __attribute__((visibility("default")))\n'
+                         '#endif\n'.format(self.getBuildMacro(),
+                                           self.getApiMacro())])
+
+    def __details(self):
+        '''
+        Return the include_depth detail headers, each includes the next
+        one and the first is included by the library header.
+        '''
+        lib_name = self.getLibName()
+        headers = []
+        for k in range(0, self.include_depth):
+            name = '{0}_detail{1}'.format(lib_name, k)
+            includes = []
+            if k + 1 < self.include_depth:
+                includes = ['{0}_detail{1}.h'.format(lib_name, k + 1)]
+            if self.lang == 'cpp':
+                if includes:
+                    value = '{0}_detail{1}<T>::apply(x) + T({1})'.format(
+                        lib_name, k + 1)
+                else:
+                    value = 'x'
+                header = Header(
+                    file_path=self.lib_path + '/include/' + name + '.h',
+                    comments=['Detail {0} of {1}'.format(k, lib_name)],
+                    includes=includes,
+                    definitions=['template <typename T>\n'
+                                 'struct {0} {{\n'
+                                 '    static T apply(T x) {{\n'
+                                 '        return {1};\n'
+                                 '    }}\n'
+                                 '}};\n'.format(name, value)])
+            else:
+                header = Header(
+                    file_path=self.lib_path + '/include/' + name + '.h',
+                    comments=['Detail {0} of {1}'.format(k, lib_name)],
+                    includes=includes,
+                    type_declarations=['typedef struct {{ int v; }} {0}_t'.format(
+                        name)])
+            headers.append(header)
+        return headers
+
+    def __files(self):
+        '''
+        Return the paths of the files of the library and the Header or
+        LibrarySrc rendering each, in the order they are written.
+        '''
+        lib_name = self.getLibName()
+        header_path = self.lib_path + '/include/' + lib_name + '.h'
 
-        self.__lib_header = Header(
+        lib_header = Header(
             file_path=header_path,
             comments=['header....'],
             sys_includes=['stdio.h'],
-            type_declarations=['typedef int {0}_status'.format(lib_name)])
-
-        self.__lib_source = LibrarySrc(file_path=src_path,
-                                       func_range=self.func_range,
-                                       comments=['Test library 1'],
-                                       includes=[self.__lib_header.get_name()],
-                                       header=self.__lib_header)
-
-        self.__lib_source.write(f)
-        self.__lib_header.write(h)
+            type_declarations=['typedef int {0}_status'.format(lib_name)] +
+            self.type_declarations,
+            functions=self.__functions)
+        files = []
+        if self.linkage == 'shared':
+            export_header = self.__export_header()
+            lib_header.includes.append(export_header.get_name())
+            files.append((export_header.file_path, export_header))
+        if self.include_depth:
+            lib_header.includes.append(lib_name + '_detail0.h')
+            files.extend((header.file_path, header)
+                         for header in self.__details())
+        if self.lang == 'cpp':
+            lib_header.definitions = self.__render_templates()
+
+        includes = [lib_header.get_name()]
+        if self.internal_header:
+            internal_path = self.lib_path + '/src/' + lib_name + '_internal.h'
+            internal_header = Header(
+                file_path=internal_path,
+                comments=['Internal header of {0}'.format(lib_name)],
+                includes=[lib_header.get_name()],
+                type_declarations=[
+                    'typedef int {0}_internal_status'.format(lib_name)])
+            files.append((internal_path, internal_header))
+            includes = [internal_header.get_name()]
+        for dep in self.__dependencies:
+            includes.append(dep.getLibHeaderName())
+
+        for source, functions in self.getSourceFunctions():
+            src_path = self.lib_path + '/' + source
+            lib_source = LibrarySrc(file_path=src_path,
+                                    functions=functions,
+                                    comments=['Test library 1'],
+                                    includes=includes)
+            files.append((src_path, lib_source))
+        files.append((header_path, lib_header))
+        return files
+
+    def create(self, writer):
+        '''
+        Create a library with the name of defined by the basename(lib_path)
+        it will include a src/ and an include/ directory. With
+        internal_header the sources include a private src/<name>_internal.h
+        which includes the public header.
+        '''
+        for path, content in self.__files():
+            writer.write(path, content.render())
 
-        f.close()
-        h.close()
+    def plan(self, planner):
+        '''
+        Add the files create() would write and their sizes to *planner*
+        '''
+        for path, content in self.__files():
+            planner.add(path, content.size())
 
 
 class Application:
@@ -312,11 +1092,18 @@ class Application:
     '''
     __app_path = None
     __libraries = None
+    __shard_count = 0
+    __statements = None
+    __ext = '.c'
 
     # Initializer
-    def __init__(self, path='', libraries=None):
+    def __init__(self, path='', libraries=None, shard_count=0, statements=None,
+                 lang='c'):
         self.__app_path = path
         self.__libraries = libraries if libraries else []
+        self.__shard_count = min(shard_count, len(self.__libraries))
+        self.__statements = statements if statements else []
+        self.__ext = languages[lang]['ext']
 
     def getAppName(self):
         return os.path.basename(self.__app_path)
@@ -327,42 +1114,130 @@ class Application:
     def getAppPath(self):
         return self.__app_path
 
-    def create(self):
+    def getSources(self):
+        '''
+        Return the source files of the application relative to its path
+        '''
+        sources = ['src/main' + self.__ext]
+        for name, libs in self.__shards():
+            sources.append('src/{0}{1}'.format(name, self.__ext))
+        return sources
+
+    def getSourceLibraries(self):
+        '''
+        Return the source files of the application with the libraries
+        whose headers each of them includes
+        '''
+        if self.__shard_count == 0:
+            return [('src/main' + self.__ext, self.__libraries)]
+        sources = [('src/main' + self.__ext, [])]
+        for name, libs in self.__shards():
+            sources.append(('src/{0}{1}'.format(name, self.__ext), libs))
+        return sources
+
+    def __shards(self):
+        '''
+        Split the libraries into shard_count contiguous groups, each
+        group is named after the first library it drives.
+        '''
+        count = self.__shard_count
+        total = len(self.__libraries)
+        for i in range(0, count):
+            libs = self.__libraries[i * total // count:(i + 1) * total // count]
+            yield 'drive_{0}'.format(libs[0].getLibName()), libs
+
+    def __render_calls(self, libs, indent):
+        '''
+        Yield the statements calling every function of *libs*, one
+        chunk per library
+        '''
+        for lib in libs:
+            out = []
+            for name in lib.getFunctions().names():
+                out.append('{0}{1}();\n'.format(indent, name))
+            yield ''.join(out)
+
+    def __render_includes(self, libs):
+        out = ['#include <stdio.h>\n']
+        for lib in libs:
+            out.append('#include "{0}"\n'.format(lib.getLibHeaderName()))
+        return ''.join(out)
+
+    @staticmethod
+    def _call(functions, i):
+        return '  {0}();\n'.format(functions.getName(i))
+
+    def __calls_size(self, libs):
+        '''
+        Return the length of the statements of __render_calls() with
+        the indent of the applications
+        '''
+        return sum(lib.getFunctions().size(Application._call) for lib in libs)
+
+    def __render_main(self, calls=True):
+        if self.__shard_count == 0:
+            yield self.__render_includes(self.__libraries)
+            yield 'int main(void) {\n'
+            if calls:
+                yield from self.__render_calls(self.__libraries, '  ')
+        else:
+            shards = [name for name, libs in self.__shards()]
+            out = ['#include <stdio.h>\n']
+            for name in shards:
+                out.append('void {0}(void);\n'.format(name))
+            out.append('int main(void) {\n')
+            for name in shards:
+                out.append('  {0}();\n'.format(name))
+            yield ''.join(out)
+        for statement in self.__statements:
+            yield '  {0};\n'.format(statement)
+        yield '  return 0; // ok\n'
+        yield '}\n'
+
+    def __render_driver(self, name, libs, calls=True):
+        yield self.__render_includes(libs)
+        yield 'void {0}(void) {{\n'.format(name)
+        if calls:
+            yield from self.__render_calls(libs, '  ')
+        yield '}\n'
+
+    def create(self, writer):
         '''
         Create a test application with a src/main.c file
         and is dependent upon all of the libraries and invokes
-        every library function.
-        '''
-
-        # Create a list of includes and body statements
-        includes = []
-        includes.append('<stdio.h>')
-        body = []
-        for lib in self.__libraries:
-            includes.append('"{0}"'.format(lib.getLibHeaderName()))
-            for func in lib.getFunctions():
-                if len(func.params) != 0:
-                    raise Exception(
-                        'Only handles functions with no parameters: {0}:{1}'.format(
-                            lib.getLibName(), func.func_sig()))
-                body.append('{0}();'.format(func.getName()))
-
-        # Create the test app
-        src_path = self.__app_path + '/src/main.c'
-        os.makedirs(os.path.dirname(src_path), exist_ok=True)
-
-        f = open(src_path, 'w')
-        for inc in includes:
-            print('#include {0}'.format(inc), file=f)
-        print('int main(void) {', file=f)
-        for statement in body:
-            print('  {0}'.format(statement), file=f)
-        print('  return 0; // ok', file=f)
-        print('}', file=f)
-        f.close()
+        every library function. When shard_count is > 0 the calls
+        are split across that many src/drive_<lib>.c files and
+        main() calls the entry point of each.
+        '''
+        for name, libs in self.__shards():
+            writer.write_chunks(self.__app_path + '/src/{0}{1}'.format(
+                name, self.__ext), self.__render_driver(name, libs))
+
+        writer.write_chunks(self.__app_path + '/src/main' + self.__ext,
+                            self.__render_main())
+
+    def plan(self, planner):
+        '''
+        Add the files create() would write and their sizes to *planner*
+        without rendering the calls one by one
+        '''
+        for name, libs in self.__shards():
+            chunks = self.__render_driver(name, libs, calls=False)
+            planner.add(self.__app_path + '/src/{0}{1}'.format(
+                name, self.__ext), len(''.join(chunks).encode()) +
+                self.__calls_size(libs))
+
+        size = len(''.join(self.__render_main(calls=False)).encode())
+        if self.__shard_count == 0:
+            size += self.__calls_size(self.__libraries)
+        planner.add(self.__app_path + '/src/main' + self.__ext, size)
 
 
 class MesonBuilder:
+    writer = None
+    lang = 'c'
+    linkage = 'static'
+    unity = False
     __libraries_file = None
     __apps_file = None
 
@@ -372,73 +1247,101 @@ class MesonBuilder:
     def begRoot(self, root_path, applications_path, libraries_path):
         apps_rel_path = os.path.relpath(applications_path, root_path)
         libs_rel_path = os.path.relpath(libraries_path, root_path)
-        r = open(root_path + '/meson.build', 'w')
 
-        print("project('hierarchy', 'c')\n"
-              "add_global_arguments('-std=c99', language : 'c')\n"
-              "\n"
-              "subdir(\'{0}\')\n"
-              "subdir(\'{1}\')\n".format(libs_rel_path, apps_rel_path),
-              file=r)
-
-        r.close()
+        lang = languages[self.lang]
+        # declare_dependency() takes objects since Meson 1.1
+        options = ''
+        if self.linkage == 'object':
+            options += ", meson_version : '>=1.1.0'"
+        if self.unity:
+            options += ", default_options : ['unity=on']"
+        self.writer.write(root_path + '/meson.build',
+                          "project('hierarchy', '{2}'{4})\n"
+                          "add_global_arguments('{3}', language : '{2}')\n"
+                          "\n"
+                          "subdir(\'{0}\')\n"
+                          "subdir(\'{1}\')\n"
+                          "\n".format(libs_rel_path, apps_rel_path, lang['meson'],
+                                      lang['std'], options))
 
     def endRoot(self):
         pass
 
     def begAppBuilder(self, app_path):
-        apps_path = app_path + '/meson.build'
-        self.__apps_file = open(apps_path, 'w')
+        self.__apps_path = app_path + '/meson.build'
+        self.__apps_file = []
 
     def endAppBuilder(self):
-        self.__apps_file.close()
+        self.writer.write(self.__apps_path, ''.join(self.__apps_file))
+        self.__apps_file = None
 
     def addAppToAppBuilder(self, app):
-        builder_path = app.getAppPath() + '/meson.build'
-        os.makedirs(os.path.dirname(builder_path), exist_ok=True)
-        b = open(builder_path, 'w')
-
-        print("executable('{0}',\n"
-              "  'src/main.c',\n"
-              "  install : true,".format(app.getAppName()),
-              file=b)
-        print("  dependencies : [", file=b)
+        out = ["executable('{0}',\n".format(app.getAppName())]
+        for source in app.getSources():
+            out.append("  '{0}',\n".format(source))
+        out.append("  install : true,\n")
+        out.append("  dependencies : [\n")
         for lib in app.getLibraries():
-            print('    lib{0}_dep,'.format(lib.getLibName()), file=b)
-        print("  ])", file=b)
+            out.append('    lib{0}_dep,\n'.format(lib.getLibName()))
+        out.append("  ])\n")
+        self.writer.write(app.getAppPath() + '/meson.build', ''.join(out))
 
         # Add a line for this library in the parent directory
-        print('subdir(\'{0}\')'.format(app.getAppName()), file=self.__apps_file)
-
-        b.close()
+        self.__apps_file.append('subdir(\'{0}\')\n'.format(app.getAppName()))
 
     def begLibBuilder(self, libraries_path):
-        libraries_path = libraries_path + '/meson.build'
-        self.__libraries_file = open(libraries_path, 'w')
+        self.__libraries_path = libraries_path
+        self.__libraries_file = []
 
     def endLibBuilder(self):
-        self.__libraries_file.close()
+        # A meson.build in libs/ and in each directory nesting libraries
+        tree = directory_tree(self.__libraries_path, self.__libraries_file)
+        for dir_path, children in tree.items():
+            self.writer.write(dir_path + '/meson.build', ''.join(
+                "subdir('{0}')\n".format(os.path.basename(child))
+                for child in children))
+        self.__libraries_file = None
 
     def addLibToLibBuilder(self, library):
-        builder_path = library.getLibPath() + '/meson.build'
-        os.makedirs(os.path.dirname(builder_path), exist_ok=True)
-        b = open(builder_path, 'w')
-
-        print(
+        lib_name = library.getLibName()
+        deps = library.getDependencies()
+        sources = ', '.join("'{0}'".format(source)
+                            for source in library.getSources())
+
+        # An object library is a static library which isn't built by
+        # default, its dependency hands its objects to the executables
+        function = 'shared_library' if self.linkage == 'shared' else \
+            'static_library'
+        args = ''
+        link = 'link_with : lib{0}'.format(lib_name)
+        if self.linkage == 'shared':
+            args = (",\n  gnu_symbol_visibility : 'hidden', "
+                    "{0}_args : '-D{1}'".format(languages[self.lang]['meson'],
+                                                library.getBuildMacro()))
+        elif self.linkage == 'object':
+            args = ',\n  build_by_default : false'
+            link = 'objects : lib{0}.extract_all_objects(recursive : false)'.format(
+                lib_name)
+        dep_list = ''
+        if deps:
+            dep_list = ',\n  dependencies : [{0}]'.format(', '.join(
+                'lib{0}_dep'.format(dep.getLibName()) for dep in deps))
+        content = (
             "incs = include_directories('include')\n"
-            "lib{0} = static_library('{0}', 'src/{0}.c', include_directories: incs)\n"
-            "lib{0}_dep = declare_dependency(include_directories : incs, link_with : lib{0})\n".format(
-                library.getLibName()),
-            file=b)
-
-        # Add a line for this library in the parent directory
-        print('subdir(\'{0}\')'.format(library.getLibName()),
-              file=self.__libraries_file)
+            "lib{0} = {1}('{0}', {2}, include_directories: incs{3}{4})\n"
+            "lib{0}_dep = declare_dependency(include_directories : incs, {5}{4})\n"
+            "\n".format(lib_name, function, sources, args, dep_list, link))
+        self.writer.write(library.getLibPath() + '/meson.build', content)
 
-        b.close()
+        # Add this library to its parent directory
+        self.__libraries_file.append(library.getLibPath())
 
 
 class CMakeBuilder:
+    writer = None
+    lang = 'c'
+    linkage = 'static'
+    unity = False
     __libraries_file = None
     __apps_file = None
 
@@ -448,131 +1351,457 @@ class CMakeBuilder:
     def begRoot(self, root_path, applications_path, libraries_path):
         apps_rel_path = os.path.relpath(applications_path, root_path)
         libs_rel_path = os.path.relpath(libraries_path, root_path)
-        r = open(root_path + '/CMakeLists.txt', 'w')
-
-        print('cmake_minimum_required (VERSION 3.2)\n'
-              'project("hierarchy")\n'
-              'enable_language(C)\n'
-              '\n'
-              'find_program(CCACHE_FOUND ccache)\n'
-              'if(CCACHE_FOUND)\n'
-              '      set_property(GLOBAL PROPERTY RULE_LAUNCH_COMPILE ccache)\n'
-              '      set_property(GLOBAL PROPERTY RULE_LAUNCH_LINK ccache)\n'
-              '  endif(CCACHE_FOUND)\n'
-              '\n'
-              'add_subdirectory("{0}")\n'
-              'add_subdirectory("{1}")\n'.format(libs_rel_path, apps_rel_path),
-              file=r)
-
-        r.close()
+
+        # Object libraries are linked since CMake 3.12 and unity builds
+        # are supported since 3.16
+        version = '3.2'
+        if self.unity:
+            version = '3.16'
+        elif self.linkage == 'object':
+            version = '3.12'
+        settings = ''
+        if self.lang == 'cpp':
+            settings += 'set(CMAKE_CXX_STANDARD 11)\n'
+        if self.unity:
+            settings += 'set(CMAKE_UNITY_BUILD ON)\n'
+        self.writer.write(root_path + '/CMakeLists.txt',
+                          'cmake_minimum_required (VERSION {4})\n'
+                          'project("hierarchy")\n'
+                          'enable_language({2})\n'
+                          '{3}'
+                          '\n'
+                          'find_program(CCACHE_FOUND ccache)\n'
+                          'if(CCACHE_FOUND)\n'
+                          '      set_property(GLOBAL PROPERTY RULE_LAUNCH_COMPILE ccache)\n'
+                          '      set_property(GLOBAL PROPERTY RULE_LAUNCH_LINK ccache)\n'
+                          '  endif(CCACHE_FOUND)\n'
+                          '\n'
+                          'add_subdirectory("{0}")\n'
+                          'add_subdirectory("{1}")\n'
+                          '\n'.format(libs_rel_path, apps_rel_path,
+                                      languages[self.lang]['cmake'], settings,
+                                      version))
 
     def endRoot(self):
         pass
 
     def begAppBuilder(self, app_path):
-        apps_path = app_path + '/CMakeLists.txt'
-        self.__apps_file = open(apps_path, 'w')
+        self.__apps_path = app_path + '/CMakeLists.txt'
+        self.__apps_file = []
 
     def endAppBuilder(self):
-        self.__apps_file.close()
+        self.writer.write(self.__apps_path, ''.join(self.__apps_file))
+        self.__apps_file = None
 
     def addAppToAppBuilder(self, app):
-        builder_path = app.getAppPath() + '/CMakeLists.txt'
-        os.makedirs(os.path.dirname(builder_path), exist_ok=True)
-        b = open(builder_path, 'w')
-
-        print('add_executable({0} src/main.c)\n'
-              'target_link_libraries({0}'.format(app.getAppName()),
-              file=b)
+        out = ['add_executable({0} {1})\n'
+               'target_link_libraries({0}\n'.format(
+                   app.getAppName(), ' '.join(app.getSources()))]
         for lib in app.getLibraries():
-            print('    {0}'.format(lib.getLibName()), file=b)
-        print(")", file=b)
+            out.append('    {0}\n'.format(lib.getLibName()))
+        out.append(")\n")
+        self.writer.write(app.getAppPath() + '/CMakeLists.txt', ''.join(out))
 
         # Add a line for this library in the parent directory
-        print('add_subdirectory("{0}")'.format(app.getAppName()),
-              file=self.__apps_file)
-
-        b.close()
+        self.__apps_file.append(
+            'add_subdirectory("{0}")\n'.format(app.getAppName()))
 
     def begLibBuilder(self, libraries_path):
-        libraries_path = libraries_path + '/CMakeLists.txt'
-        self.__libraries_file = open(libraries_path, 'w')
+        self.__libraries_path = libraries_path
+        self.__libraries_file = []
 
     def endLibBuilder(self):
-        self.__libraries_file.close()
+        # A CMakeLists.txt in libs/ and in each directory nesting libraries
+        tree = directory_tree(self.__libraries_path, self.__libraries_file)
+        for dir_path, children in tree.items():
+            self.writer.write(dir_path + '/CMakeLists.txt', ''.join(
+                'add_subdirectory("{0}")\n'.format(os.path.basename(child))
+                for child in children))
+        self.__libraries_file = None
 
     def addLibToLibBuilder(self, library):
-        builder_path = library.getLibPath() + '/CMakeLists.txt'
-        os.makedirs(os.path.dirname(builder_path), exist_ok=True)
-        b = open(builder_path, 'w')
-
-        print('add_library({0} STATIC\n'
-              '    src/{0}.c\n'
-              ')\n'
-              'target_include_directories({0} PUBLIC "include")\n'.format(
-                  library.getLibName()),
-              file=b)
-
-        # Add a line for this library in the parent directory
-        print('add_subdirectory("{0}")'.format(library.getLibName()),
-              file=self.__libraries_file)
-
-        b.close()
+        out = ['add_library({0} {1}\n'.format(library.getLibName(),
+                                              self.linkage.upper())]
+        for source in library.getSources():
+            out.append('    {0}\n'.format(source))
+        out.append(')\n'
+                   'target_include_directories({0} PUBLIC "include")\n'.format(
+                       library.getLibName()))
+        if self.linkage == 'shared':
+            out.append('set_target_properties({0} PROPERTIES\n'
+                       '    {1}_VISIBILITY_PRESET hidden\n'
+                       '    DEFINE_SYMBOL {2}\n'
+                       ')\n'.format(library.getLibName(),
+                                    languages[self.lang]['cmake'],
+                                    library.getBuildMacro()))
+        deps = library.getDependencies()
+        if deps:
+            out.append('target_link_libraries({0} PRIVATE\n'.format(
+                library.getLibName()))
+            for dep in deps:
+                out.append('    {0}\n'.format(dep.getLibName()))
+            out.append(')\n')
+        out.append('\n')
+        self.writer.write(library.getLibPath() + '/CMakeLists.txt', ''.join(out))
+
+        # Add this library to its parent directory
+        self.__libraries_file.append(library.getLibPath())
 
 
 class CraftrBuilder(object):
+    writer = None
+    lang = 'c'
+    linkage = 'static'
+    unity = False
 
     def begRoot(self, root_path, applications_path, libraries_path):
-        from os.path import join, relpath, isdir
+        from os.path import join, relpath
 
         apps_path = relpath(applications_path, root_path)
         libs_path = relpath(libraries_path, root_path)
-        shutil.copy(template('craftr/hierarchy.craftr'), join(root_path, 'Craftfile'))
+        self.writer.copy(template('craftr/hierarchy.craftr'), join(root_path, 'Craftfile'))
 
         tmpdir = join(root_path, '.craftr')
-        if not isdir(tmpdir):
-            os.mkdir(tmpdir)
-        shutil.copy(template('craftr/libs.template.craftr'), tmpdir)
-        shutil.copy(template('craftr/apps.template.craftr'), tmpdir)
-        shutil.copy(template('craftr/utils.ccache.craftr'), tmpdir)
+        for name in ('libs.template.craftr', 'apps.template.craftr',
+                     'utils.ccache.craftr'):
+            self.writer.copy(template('craftr/' + name), join(tmpdir, name))
 
     def endRoot(self):
         pass
 
     def begAppBuilder(self, app_path):
-        self._apps_file = open(os.path.join(app_path, 'Craftfile'), 'w')
-        self._apps_file.write('# craftr_module(apps)\n')
+        self._apps_path = os.path.join(app_path, 'Craftfile')
+        self._apps_file = ['# craftr_module(apps)\n']
 
     def endAppBuilder(self):
-        self._apps_file.close()
+        self.writer.write(self._apps_path, ''.join(self._apps_file))
         del self._apps_file
 
-    def addAppToAppBuilder(self, app):
-        self._apps_file.write("load_module('apps.{0}')\n".format(app.getAppName()))
+    def __unity(self, target_path, name, sources):
+        '''
+        Write a source of the target at *target_path* which includes
+        all of its *sources* and return it as the only source, Craftr
+        has no unity builds of its own.
+        '''
+        unity = 'unity/{0}_unity{1}'.format(name, languages[self.lang]['ext'])
+        self.writer.write(os.path.join(target_path, unity), ''.join(
+            ['// Unity source of {0}\n'.format(name)] +
+            ['#include "../{0}"\n'.format(source) for source in sources]))
+        return [unity]
 
-        with open(os.path.join(app.getAppPath(), 'Craftfile'), 'w') as fp:
-            requires = []
-            for lib in app.getLibraries():
-                requires.append('libs.' + lib.getLibName())
+    def addAppToAppBuilder(self, app):
+        self._apps_file.append("load_module('apps.{0}')\n".format(app.getAppName()))
 
-            fp.write('# craftr_module(apps.{0})\n'.format(app.getAppName()))
-            fp.write('requires = {0!r}\n'.format(requires))
-            fp.write("extends('apps.template')\n")
+        requires = []
+        for lib in app.getLibraries():
+            requires.append('libs.' + lib.getLibName())
+
+        out = ['# craftr_module(apps.{0})\n'.format(app.getAppName()),
+               'requires = {0!r}\n'.format(requires)]
+        sources = app.getSources()
+        if self.unity and len(sources) > 1:
+            sources = self.__unity(app.getAppPath(), app.getAppName(), sources)
+        if len(app.getSources()) > 1:
+            out.append('sources = {0!r}\n'.format(sources))
+        if self.lang != 'c':
+            out.append('language = {0!r}\n'.format(self.lang))
+        if self.linkage != 'static':
+            out.append('linkage = {0!r}\n'.format(self.linkage))
+        out.append("extends('apps.template')\n")
+        self.writer.write(os.path.join(app.getAppPath(), 'Craftfile'),
+                          ''.join(out))
 
     def begLibBuilder(self, libraries_path):
-        self._libs_file = open(os.path.join(libraries_path, 'Craftfile'), 'w')
-        self._libs_file.write('# craftr_module(libs)\n')
+        self._libs_path = libraries_path
+        self._libs_file = []
 
     def endLibBuilder(self):
-        self._libs_file.close()
+        # The module of a directory nesting libraries adds itself to the
+        # search path so the modules of its children are found
+        lib_paths = set(self._libs_file)
+        tree = directory_tree(self._libs_path, self._libs_file)
+        for dir_path, children in tree.items():
+            out = ['# craftr_module({0})\n'.format(
+                self.__module(dir_path, lib_paths))]
+            if dir_path != self._libs_path:
+                out.append('session.path.append(project_dir)\n')
+            for child in children:
+                out.append("load_module('{0}')\n".format(
+                    self.__module(child, lib_paths)))
+            self.writer.write(os.path.join(dir_path, 'Craftfile'),
+                              ''.join(out))
         del self._libs_file
 
+    def __module(self, path, lib_paths):
+        if path in lib_paths:
+            return 'libs.' + os.path.basename(path)
+        rel_path = os.path.relpath(path, self._libs_path)
+        if rel_path == '.':
+            return 'libs'
+        return 'libs.' + rel_path.replace(os.sep, '.')
+
     def addLibToLibBuilder(self, lib):
-        self._libs_file.write("load_module('libs.{0}')\n".format(lib.getLibName()))
+        self._libs_file.append(lib.getLibPath())
+
+        out = ['# craftr_module(libs.{0})\n'.format(lib.getLibName())]
+        if lib.getDependencies():
+            requires = ['libs.' + dep.getLibName()
+                        for dep in lib.getDependencies()]
+            out.append('requires = {0!r}\n'.format(requires))
+        sources = lib.getSources()
+        if self.unity and len(sources) > 1:
+            sources = self.__unity(lib.getLibPath(), lib.getLibName(), sources)
+        if len(lib.getSources()) > 1:
+            out.append('sources = {0!r}\n'.format(sources))
+        if self.lang != 'c':
+            out.append('language = {0!r}\n'.format(self.lang))
+        if self.linkage != 'static':
+            out.append('linkage = {0!r}\n'.format(self.linkage))
+        out.append("extends('libs.template')\n")
+        self.writer.write(os.path.join(lib.getLibPath(), 'Craftfile'),
+                          ''.join(out))
+
+
+class NinjaBuilder:
+    '''
+    Generate a single flat build.ninja in the root of the hierarchy,
+    there is no meta build system so it is a baseline for the others.
+    Objects, libraries and applications are built in build/ and
+    header dependencies are tracked with depfiles.
+    '''
+    writer = None
+    lang = 'c'
+    __root_path = None
+    __apps = None
+    __libs = None
+
+    def __init__(self):
+        pass
+
+    def __rel(self, path):
+        return ninja_escape(os.path.relpath(path, self.__root_path))
+
+    def __object(self, path):
+        return 'build/' + os.path.splitext(self.__rel(path))[0] + '.o'
+
+    def __lib_archive(self, lib):
+        return 'build/{0}/lib{1}.a'.format(self.__rel(lib.getLibPath()),
+                                           lib.getLibName())
+
+    def begRoot(self, root_path, applications_path, libraries_path):
+        self.__root_path = root_path
+        self.__apps = []
+        self.__libs = []
+
+    def endRoot(self):
+        out = ['# Generated by gen_srcs.py\n'
+               'ninja_required_version = 1.3\n'
+               'builddir = build\n'
+               '\n'
+               'cc = {cc}\n'
+               'ar = ar\n'
+               'cflags = {std}\n'
+               '\n'
+               'rule cc\n'
+               '  command = $cc -MMD -MF $out.d $cflags -c $in -o $out\n'
+               '  depfile = $out.d\n'
+               '  deps = gcc\n'
+               '  description = CC $out\n'
+               '\n'
+               'rule ar\n'
+               '  command = rm -f $out && $ar crs $out $in\n'
+               '  description = AR $out\n'
+               '\n'
+               'rule link\n'
+               '  command = $cc -o $out $in $libs\n'
+               '  description = LINK $out\n'
+               '\n'.format(**languages[self.lang])]
+        out.extend(self.__libs)
+        out.extend(self.__apps)
+        self.writer.write(self.__root_path + '/build.ninja', ''.join(out))
+        self.__apps = None
+        self.__libs = None
+
+    def begAppBuilder(self, app_path):
+        pass
+
+    def endAppBuilder(self):
+        pass
+
+    def addAppToAppBuilder(self, app):
+        includes = ' '.join('-I' + self.__rel(lib.getLibPath() + '/include')
+                            for lib in app.getLibraries())
+        archives = ' '.join(self.__lib_archive(lib)
+                            for lib in app.getLibraries())
+        objects = []
+        out = []
+        for source in app.getSources():
+            source_path = app.getAppPath() + '/' + source
+            objects.append(self.__object(source_path))
+            out.append('build {0}: cc {1}\n'
+                       '  cflags = $cflags {2}\n'.format(
+                           objects[-1], self.__rel(source_path), includes))
+        binary = 'build/{0}/{1}'.format(self.__rel(app.getAppPath()),
+                                        app.getAppName())
+        out.append('build {0}: link {1} | {2}\n'
+                   '  libs = {2}\n'
+                   'default {0}\n'
+                   '\n'.format(binary, ' '.join(objects), archives))
+        self.__apps.append(''.join(out))
+
+    def begLibBuilder(self, libraries_path):
+        pass
+
+    def endLibBuilder(self):
+        pass
+
+    def addLibToLibBuilder(self, library):
+        includes = [library.getLibPath() + '/include']
+        for dep in library.getDependencies():
+            includes.append(dep.getLibPath() + '/include')
+        includes = ' '.join('-I' + self.__rel(path) for path in includes)
 
-        with open(os.path.join(lib.getLibPath(), 'Craftfile'), 'w') as fp:
-            fp.write('# craftr_module(libs.{0})\n'.format(lib.getLibName()))
-            fp.write("extends('libs.template')\n")
+        objects = []
+        out = []
+        for source in library.getSources():
+            source_path = library.getLibPath() + '/' + source
+            objects.append(self.__object(source_path))
+            out.append('build {0}: cc {1}\n'
+                       '  cflags = $cflags {2}\n'.format(
+                           objects[-1], self.__rel(source_path), includes))
+        out.append('build {0}: ar {1}\n'
+                   '\n'.format(self.__lib_archive(library), ' '.join(objects)))
+        self.__libs.append(''.join(out))
+
+
+def ninja_escape(path):
+    return path.replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+
+class MakeBuilder:
+    '''
+    Generate a single non-recursive Makefile in the root of the
+    hierarchy. Objects, libraries and applications are built in
+    build/, header dependencies come from the -MMD -MP files and
+    every dependency is explicit so make -j is parallel across
+    libraries and applications.
+    '''
+    writer = None
+    lang = 'c'
+    __root_path = None
+    __apps = None
+    __libs = None
+    __binaries = None
+
+    def __init__(self):
+        pass
+
+    def __rel(self, path):
+        return os.path.relpath(path, self.__root_path)
+
+    def __object(self, path):
+        return 'build/' + os.path.splitext(self.__rel(path))[0] + '.o'
+
+    def __lib_archive(self, lib):
+        return 'build/{0}/lib{1}.a'.format(self.__rel(lib.getLibPath()),
+                                           lib.getLibName())
+
+    def __objects(self, out, sources, includes):
+        objects = []
+        for source_path in sources:
+            objects.append(self.__object(source_path))
+            out.append('{0}: INCLUDES := {1}\n'
+                       '{0}: {2}\n'.format(objects[-1], includes,
+                                           self.__rel(source_path)))
+        out.append('OBJS += {0}\n'.format(' '.join(objects)))
+        return objects
+
+    def begRoot(self, root_path, applications_path, libraries_path):
+        self.__root_path = root_path
+        self.__apps = []
+        self.__libs = []
+        self.__binaries = []
+
+    def endRoot(self):
+        out = ['# Generated by gen_srcs.py\n'
+               '{cc_var} = {cc}\n'
+               'AR = ar\n'
+               '{flags_var} = {std}\n'
+               '\n'
+               '.PHONY: all clean\n'
+               'all: {0}\n'
+               '\n'
+               'build/%.o: %{ext}\n'
+               '\t@mkdir -p $(@D)\n'
+               '\t$({cc_var}) $({flags_var}) $(INCLUDES) -MMD -MP -c $< -o $@\n'
+               '\n'.format(' '.join(self.__binaries),
+                           **languages[self.lang])]
+        out.extend(self.__libs)
+        out.extend(self.__apps)
+        out.append('clean:\n'
+                   '\trm -rf build\n'
+                   '\n'
+                   '-include $(OBJS:.o=.d)\n')
+        self.writer.write(self.__root_path + '/Makefile', ''.join(out))
+        self.__apps = None
+        self.__libs = None
+        self.__binaries = None
+
+    def begAppBuilder(self, app_path):
+        pass
+
+    def endAppBuilder(self):
+        pass
+
+    def addAppToAppBuilder(self, app):
+        includes = ' '.join('-I' + self.__rel(lib.getLibPath() + '/include')
+                            for lib in app.getLibraries())
+        archives = ' '.join(self.__lib_archive(lib)
+                            for lib in app.getLibraries())
+        out = []
+        objects = self.__objects(out, [app.getAppPath() + '/' + source
+                                       for source in app.getSources()],
+                                 includes)
+        binary = 'build/{0}/{1}'.format(self.__rel(app.getAppPath()),
+                                        app.getAppName())
+        out.append('{0}: {1} {2}\n'
+                   '\t$({3}) -o $@ $(filter %.o,$^) $(filter %.a,$^)\n'
+                   '\n'.format(binary, ' '.join(objects), archives,
+                               languages[self.lang]['cc_var']))
+        self.__apps.append(''.join(out))
+        self.__binaries.append(binary)
+
+    def begLibBuilder(self, libraries_path):
+        pass
+
+    def endLibBuilder(self):
+        pass
+
+    def addLibToLibBuilder(self, library):
+        includes = [library.getLibPath() + '/include']
+        for dep in library.getDependencies():
+            includes.append(dep.getLibPath() + '/include')
+        includes = ' '.join('-I' + self.__rel(path) for path in includes)
+
+        out = []
+        objects = self.__objects(out, [library.getLibPath() + '/' + source
+                                       for source in library.getSources()],
+                                 includes)
+        out.append('{0}: {1}\n'
+                   '\t@mkdir -p $(@D)\n'
+                   '\trm -f $@ && $(AR) crs $@ $^\n'
+                   '\n'.format(self.__lib_archive(library), ' '.join(objects)))
+        self.__libs.append(''.join(out))
+
+
+# The builders selectable on the command line
+builders = {
+    'cmake': CMakeBuilder,
+    'craftr': CraftrBuilder,
+    'make': MakeBuilder,
+    'meson': MesonBuilder,
+    'ninja': NinjaBuilder,
+}
 
 
 class Hierarchy:
@@ -582,79 +1811,2796 @@ class Hierarchy:
     hierarchy_path = None
     lib_count = None
     func_count_per_lib = None
+    jobs = 1
+    writer_threads = 0
+    force = False
+    fsync = False
+    app_shards = 0
+    files_per_lib = 1
+    internal_header = False
+    app_count = 1
+    app_select = 'all'
+    app_fraction = 1.0
+    topology = 'flat'
+    dep_fanout = 2
+    max_in_degree = 3
+    fanout = 0
+    body_profile = 'printf'
+    body_size = 1
+    lang = 'c'
+    include_depth = 0
+    linkage = 'static'
+    unity = False
+    seed = 0
+    shard = (0, 1)
+    churn = None
+    churn_units = None
+    unit_count = 0
+    edits = None
+    profile = None
     __builder = None
 
-    def __init__(self, hierarchy_path, lib_count, func_count_per_lib, builder):
+    def __init__(self, hierarchy_path, lib_count, func_count_per_lib, builder,
+                 jobs=1, writer_threads=0, force=False, fsync=False,
+                 app_shards=0, files_per_lib=1, internal_header=False, app_count=1,
+                 app_select='all', app_fraction=1.0, topology='flat',
+                 dep_fanout=2, max_in_degree=3, fanout=0,
+                 body_profile='printf', body_size=1, lang='c',
+                 include_depth=0, linkage='static', unity=False, seed=0,
+                 shard=None, churn=None, edits=None):
         self.hierarchy_path = hierarchy_path
         self.lib_count = int(lib_count)
         self.func_count_per_lib = int(func_count_per_lib)
+        self.jobs = max(1, int(jobs))
+        self.writer_threads = max(0, int(writer_threads))
+        self.force = force
+        self.fsync = fsync
+        self.app_shards = int(app_shards)
+        self.files_per_lib = int(files_per_lib)
+        self.internal_header = internal_header
+        self.app_count = int(app_count)
+        self.app_select = app_select
+        self.app_fraction = float(app_fraction)
+        self.topology = topology
+        self.dep_fanout = int(dep_fanout)
+        self.max_in_degree = int(max_in_degree)
+        self.fanout = int(fanout)
+        self.body_profile = body_profile
+        self.body_size = int(body_size)
+        self.lang = lang
+        self.include_depth = int(include_depth)
+        self.linkage = linkage
+        self.unity = bool(unity)
+        self.seed = int(seed)
+        self.shard = tuple(shard) if shard else (0, 1)
+        self.churn = churn if churn else {}
+        self.edits = edits if edits else []
+        self.profile = Profile()
         self.__builder = builder
 
-    def create(self):
+    def params(self):
         '''
-        Create files
+        Return the parameters of the hierarchy, they are recorded in the
+        manifest so the tree can be regenerated by the edit subcommand.
         '''
-        # Create root
-        os.makedirs(self.hierarchy_path, exist_ok=True)
-
-        # Create the apps and libs directories
-        apps_path = self.hierarchy_path + '/apps'
-        libraries_path = self.hierarchy_path + '/libs'
-
-        # Create the libraries
-        libraries = []
-        for i in range(0, self.lib_count):
-            base = i * self.func_count_per_lib
-            lib_path = libraries_path + '/L{:03d}'.format(base)
-            lib = Library(
-                path=lib_path,
-                func_range=range(base + 1, base + self.func_count_per_lib + 1))
-            lib.create()
-            libraries.append(lib)
-
-        # Create a test app that invokes all of the library functions
-        apps = []
-        app_path = apps_path + '/testapp'
-        app = Application(app_path, libraries=libraries)
-        app.create()
-        apps.append(app)
-
-        # Create the Meson Builder in all of the directories
-        #mesonBuilder = MesonBuilder()
-
-        self.__builder.begRoot(self.hierarchy_path, apps_path, libraries_path)
-
-        self.__builder.begAppBuilder(apps_path)
-        for app in apps:
-            self.__builder.addAppToAppBuilder(app)
-        self.__builder.endAppBuilder
-
-        self.__builder.begLibBuilder(libraries_path)
+        names = [name for name, cls in builders.items()
+                 if isinstance(self.__builder, cls)]
+        return {
+            'builder': names[0] if names else None,
+            'lib_count': self.lib_count,
+            'func_count_per_lib': self.func_count_per_lib,
+            'app_shards': self.app_shards,
+            'files_per_lib': self.files_per_lib,
+            'internal_header': self.internal_header,
+            'app_count': self.app_count,
+            'app_select': self.app_select,
+            'app_fraction': self.app_fraction,
+            'topology': self.topology,
+            'dep_fanout': self.dep_fanout,
+            'max_in_degree': self.max_in_degree,
+            'fanout': self.fanout,
+            'body_profile': self.body_profile,
+            'body_size': self.body_size,
+            'lang': self.lang,
+            'include_depth': self.include_depth,
+            'linkage': self.linkage,
+            'unity': self.unity,
+            'seed': self.seed,
+            'churn': self.churn,
+        }
+
+    def shape(self):
+        '''
+        Return the number of libraries and the number of functions added
+        to the last library after applying the edits.
+        '''
+        lib_count = self.lib_count
+        extra_funcs = 0
+        for edit in self.edits:
+            if edit['scenario'] == 'add-library':
+                lib_count += 1
+            elif edit['scenario'] == 'remove-library':
+                lib_count = max(1, lib_count - 1)
+            elif edit['scenario'] == 'add-function':
+                extra_funcs += 1
+        return lib_count, extra_funcs
+
+    def __create_libraries(self, libraries, writer):
+        '''
+        Create the libraries, when jobs > 1 they are created by a pool
+        of processes. The created libraries are returned in the same
+        order as they were passed so the output is the same as a
+        serial run.
+        '''
+        if isinstance(writer, PlanWriter):
+            for lib in libraries:
+                lib.plan(writer)
+            return libraries
+
+        if self.jobs == 1 or len(libraries) < 2:
+            for lib in libraries:
+                lib.create(writer)
+            return libraries
+
+        chunksize = max(1, len(libraries) // (self.jobs * 8))
+        with multiprocessing.Pool(self.jobs, init_worker,
+                                  writer.worker_args()) as pool:
+            for record in pool.imap(create_library, libraries, chunksize):
+                writer.merge(record)
+        return libraries
+
+    def __churn(self, lib_count, extra_funcs):
+        '''
+        Return the indices of the functions whose body and of the
+        libraries whose header is changed by the churn percentages.
+        Each category is picked from its own generator seeded by the
+        churn seed so changing one percentage doesn't move the others.
+        '''
+        seed = self.churn.get('seed', 0)
+        func_count = lib_count * self.func_count_per_lib + extra_funcs
+
+        def pick(category, total):
+            count = int(round(self.churn.get(category, 0) * total / 100.0))
+            rng = random.Random('{0}:{1}'.format(seed, category))
+            return rng.sample(range(0, total), count)
+
+        funcs = set(i + 1 for i in pick('bodies', func_count))
+        for lib in pick('libraries', lib_count):
+            base = lib * self.func_count_per_lib
+            end = base + self.func_count_per_lib + 1
+            if lib == lib_count - 1:
+                end += extra_funcs
+            funcs.update(range(base + 1, end))
+        return funcs, set(pick('headers', lib_count))
+
+    def __churn_units(self, root_path, libraries, apps, funcs, headers):
+        '''
+        Return the translation units, relative to root_path, which
+        define a changed function or include a changed header
+        '''
+        if not funcs and not headers:
+            return []
+        changed = set(libraries[i].getLibPath() for i in headers)
+        units = []
         for lib in libraries:
-            self.__builder.addLibToLibBuilder(lib)
-        self.__builder.endLibBuilder()
-
-        self.__builder.endRoot()
-
+            lib_path = lib.getLibPath()
+            hit = lib_path in changed or any(
+                dep.getLibPath() in changed for dep in lib.getDependencies())
+            for source, functions in lib.getSourceFunctions():
+                if hit or any(i in funcs for i in functions):
+                    units.append(lib_path + '/' + source)
+        for app in apps:
+            for source, libs in app.getSourceLibraries():
+                if any(lib.getLibPath() in changed for lib in libs):
+                    units.append(app.getAppPath() + '/' + source)
+        return sorted(os.path.relpath(unit, root_path) for unit in units)
 
-def template(path):
-    ''' Returns the path for the template at the specified *path*.
-    The *path* must be relative to the `templates/` directory in this
-    project. '''
+    def create(self, writer=None):
+        '''
+        Create files with *writer*, by default a FileWriter
+        '''
+        profile = self.profile
+        shard_index, shard_count = self.shard
 
-    if os.path.isabs(path):
-        raise ValueError('expected relative path')
-    return os.path.join(os.path.dirname(__file__), 'templates', path)
+        # Create root
+        with profile.phase('setup'):
+            if writer is None:
+                manifest_name = None
+                if shard_count > 1:
+                    manifest_name = FileWriter.SHARD_MANIFEST_NAME.format(
+                        shard_index, shard_count)
+                writer = FileWriter(self.hierarchy_path, force=self.force,
+                                    fsync=self.fsync,
+                                    threads=self.writer_threads,
+                                    manifest_name=manifest_name)
+            writer.begin()
+            self.__builder.writer = writer
+            self.__builder.lang = self.lang
+            self.__builder.linkage = self.linkage
+            self.__builder.unity = self.unity
+
+        # Absolute paths so they aren't resolved against the working
+        # directory for every file
+        root_path = os.path.abspath(self.hierarchy_path)
+        apps_path = root_path + '/apps'
+        libraries_path = root_path + '/libs'
+
+        # Apply the edits of the edit subcommand
+        lib_count, extra_funcs = self.shape()
+        statements = []
+        func_edits = {}
+        header_edits = {}
+        for edit in self.edits:
+            scenario = edit['scenario']
+            if scenario == 'append-main':
+                statements.append('printf("edit {0}\\n")'.format(edit['id']))
+            elif scenario == 'edit-func':
+                func_edits[edit['func']] = edit['id']
+            elif scenario == 'edit-header':
+                header_edits.setdefault(edit['library'], []).append(
+                    'typedef int L{0:03d}_edit{1}_status'.format(
+                        edit['library'] * self.func_count_per_lib, edit['id']))
+
+        # The variant of --churn-*, the edits take precedence
+        churn_funcs, churn_headers = self.__churn(lib_count, extra_funcs)
+        churn_id = 'churn{0}'.format(self.churn.get('seed', 0))
+        for i in churn_funcs:
+            func_edits.setdefault(i, churn_id)
+        for i in churn_headers:
+            header_edits.setdefault(i, []).insert(
+                0, 'typedef int L{0:03d}_{1}_status'.format(
+                    i * self.func_count_per_lib, churn_id))
+
+        # Group the function edits by library so each library only looks
+        # at its own, the functions added by add-function are in the last
+        lib_edits = {}
+        for i, edit_id in func_edits.items():
+            lib = min((i - 1) // max(1, self.func_count_per_lib),
+                      lib_count - 1)
+            lib_edits.setdefault(lib, {})[i] = edit_id
+
+        # Create the libraries, a library only depends on libraries with
+        # a higher index so they are instantiated from the last one
+        with profile.phase('libraries'):
+            graph = library_graph(self.topology, lib_count,
+                                  fanout=self.dep_fanout,
+                                  max_in_degree=self.max_in_degree,
+                                  seed=self.seed)
+            libraries = [None] * lib_count
+            for i in reversed(range(0, lib_count)):
+                base = i * self.func_count_per_lib
+                end = base + self.func_count_per_lib + 1
+                if i == lib_count - 1:
+                    end += extra_funcs
+                lib_path = libraries_path + '{0}/L{1:03d}'.format(
+                    library_dir(i, lib_count, self.fanout), base)
+                libraries[i] = Library(
+                    path=lib_path,
+                    func_range=range(base + 1, end),
+                    dependencies=[libraries[j] for j in graph[i]],
+                    file_count=self.files_per_lib,
+                    internal_header=self.internal_header,
+                    func_edits=lib_edits.get(i),
+                    type_declarations=header_edits.get(i),
+                    body_profile=self.body_profile,
+                    body_size=self.body_size,
+                    seed=self.seed,
+                    lang=self.lang,
+                    include_depth=self.include_depth,
+                    linkage=self.linkage)
+
+            # A shard creates a contiguous run of the libraries, every
+            # shard has all of them to render the build files
+            shard_libraries = libraries[
+                shard_index * lib_count // shard_count:
+                (shard_index + 1) * lib_count // shard_count]
+            writer.make_dirs(lib.getLibPath() + sub for lib in shard_libraries
+                             for sub in ('', '/include', '/src'))
+            self.__create_libraries(shard_libraries, writer)
+            if shard_count > 1:
+                self.__builder.writer = ShardWriter(
+                    writer, [lib.getLibPath() for lib in libraries],
+                    [lib.getLibPath() for lib in shard_libraries],
+                    top=shard_index == 0)
+
+        # Create the test apps, each invokes all of the functions of its
+        # libraries and of the libraries they depend on
+        with profile.phase('application'):
+            apps = []
+            selections = select_libraries(self.app_select, self.app_count,
+                                          lib_count,
+                                          fraction=self.app_fraction,
+                                          seed=self.seed)
+            for k, selection in enumerate(selections):
+                if self.app_count == 1:
+                    app_path = apps_path + '/testapp'
+                else:
+                    app_path = apps_path + '/testapp{:03d}'.format(k)
+                app_libraries = [libraries[i] for i in
+                                 dependency_closure(selection, graph)]
+                app = Application(app_path, libraries=app_libraries,
+                                  shard_count=self.app_shards,
+                                  statements=statements if k == 0 else None,
+                                  lang=self.lang)
+                if shard_index == 0 and isinstance(writer, PlanWriter):
+                    app.plan(writer)
+                elif shard_index == 0:
+                    app.create(writer)
+                apps.append(app)
+
+        self.churn_units = self.__churn_units(root_path, libraries, apps,
+                                              churn_funcs, churn_headers)
+        self.unit_count = (sum(len(lib.getSources()) for lib in libraries) +
+                           sum(len(app.getSources()) for app in apps))
+
+        with profile.phase('root_builder'):
+            self.__builder.begRoot(root_path, apps_path, libraries_path)
+
+        with profile.phase('app_builder'):
+            self.__builder.begAppBuilder(apps_path)
+            for app in apps:
+                self.__builder.addAppToAppBuilder(app)
+            self.__builder.endAppBuilder()
+
+        with profile.phase('lib_builder'):
+            # Builders which evaluate in order need the dependencies first
+            build_order = libraries
+            if any(lib.getDependencies() for lib in libraries):
+                build_order = list(reversed(libraries))
+
+            self.__builder.begLibBuilder(libraries_path)
+            for lib in build_order:
+                self.__builder.addLibToLibBuilder(lib)
+            self.__builder.endLibBuilder()
+
+        with profile.phase('finish'):
+            self.__builder.endRoot()
+            writer.finish(params=self.params(), edits=self.edits)
+        return writer
+
+
+def select_libraries(select, app_count, lib_count, fraction=1.0, seed=0):
+    '''
+    Return the indices of the libraries used by each of *app_count*
+    applications. A slice is a contiguous run of libraries, wrapping
+    around at the end, which starts at an evenly spaced offset for
+    each application.
+    '''
+    size = max(1, min(lib_count, int(round(fraction * lib_count))))
+    if select == 'all' or lib_count == 0:
+        return [list(range(0, lib_count)) for k in range(0, app_count)]
+    elif select == 'slice':
+        selections = []
+        for k in range(0, app_count):
+            start = k * lib_count // app_count
+            selections.append(sorted((start + i) % lib_count
+                                     for i in range(0, size)))
+        return selections
+    elif select == 'random':
+        rng = random.Random(seed)
+        return [sorted(rng.sample(range(0, lib_count), size))
+                for k in range(0, app_count)]
+    raise ValueError('unknown selection: {0}'.format(select))
+
+
+def dependency_closure(indices, graph):
+    '''
+    Return *indices* plus everything they depend on in *graph*, sorted
+    '''
+    closure = set()
+    pending = list(indices)
+    while pending:
+        i = pending.pop()
+        if i not in closure:
+            closure.add(i)
+            pending.extend(graph[i])
+    return sorted(closure)
 
 
-def main(args):
+def library_dir(index, count, fanout):
     '''
-    Main program
+    Return the directory of library *index* of *count* relative to
+    libs/, empty or starting with a /. With a fanout the libraries are
+    nested in levels of directories with at most fanout entries each,
+    deep enough that no directory has more.
     '''
-    if sys.version_info < (3, 4):
+    if fanout < 2:
+        return ''
+    levels = 0
+    capacity = fanout
+    while capacity < count:
+        capacity *= fanout
+        levels += 1
+
+    width = len(str(fanout - 1))
+    group = index // fanout
+    names = []
+    for level in range(0, levels):
+        names.append('/d{0:0{1}d}'.format(group % fanout, width))
+        group //= fanout
+    return ''.join(reversed(names))
+
+
+def directory_tree(root_path, paths):
+    '''
+    Return the directories from *root_path* down to the parents of
+    *paths* mapped to their children, directories and paths are in
+    the order they are first reached.
+    '''
+    tree = {root_path: {}}
+    for path in paths:
+        parent = os.path.dirname(path)
+        while True:
+            known = parent in tree
+            tree.setdefault(parent, {})[path] = None
+            if known or parent == root_path:
+                break
+            path, parent = parent, os.path.dirname(parent)
+    return {dir_path: list(children) for dir_path, children in tree.items()}
+
+
+def library_graph(topology, count, fanout=2, max_in_degree=3, seed=0):
+    '''
+    Return the dependencies of each of *count* libraries as a list of
+    lists of indices. A library only depends on libraries with a higher
+    index so the graph is acyclic and linking in index order works.
+    '''
+    graph = [[] for i in range(0, count)]
+    if topology == 'flat':
+        pass
+    elif topology == 'chain':
+        for i in range(0, count - 1):
+            graph[i] = [i + 1]
+    elif topology == 'tree':
+        for i in range(0, count):
+            graph[i] = list(range(fanout * i + 1,
+                                  min(fanout * i + fanout + 1, count)))
+    elif topology == 'diamond':
+        # The first library depends on the middle ones which all
+        # depend on the last one
+        if count == 2:
+            graph[0] = [1]
+        elif count > 2:
+            graph[0] = list(range(1, count - 1))
+            for i in range(1, count - 1):
+                graph[i] = [count - 1]
+    elif topology == 'random':
+        rng = random.Random(seed)
+        for i in range(0, count):
+            candidates = range(i + 1, count)
+            k = rng.randint(0, min(max_in_degree, len(candidates)))
+            graph[i] = sorted(rng.sample(candidates, k))
+    else:
+        raise ValueError('unknown topology: {0}'.format(topology))
+    return graph
+
+
+class Profile:
+    '''
+    Record the wall and CPU time of the phases of a generation run,
+    the CPU time includes the processes of the library pool.
+    '''
+    # Public fields
+    phases = None
+
+    # Initializer
+    def __init__(self):
+        self.phases = []
+
+    @staticmethod
+    def cpu_time():
+        cpu = time.process_time()
+        if resource:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu += usage.ru_utime + usage.ru_stime
+        return cpu
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''
+        Time the body of the with statement as phase *name*
+        '''
+        wall = time.perf_counter()
+        cpu = self.cpu_time()
+        try:
+            yield
+        finally:
+            self.phases.append({'name': name,
+                                'wall': time.perf_counter() - wall,
+                                'cpu': self.cpu_time() - cpu})
+
+    def as_json(self, writer):
+        '''
+        Return the phases and what *writer* did as a dictionary
+        '''
+        wall = sum(phase['wall'] for phase in self.phases)
+        files = writer.written + writer.skipped
+        return {
+            'phases': self.phases,
+            'wall': wall,
+            'cpu': sum(phase['cpu'] for phase in self.phases),
+            'files': files,
+            'files_written': writer.written,
+            'files_skipped': writer.skipped,
+            'files_deleted': writer.deleted,
+            'dirs_created': writer.dirs_created,
+            'bytes_written': writer.bytes_written,
+            'files_per_sec': files / wall if wall else 0.0,
+            'mb_per_sec': writer.bytes_written / wall / 1e6 if wall else 0.0,
+        }
+
+
+class FileWriter:
+    '''
+    Write generated files below root_path and keep a manifest of
+    their content hashes in the root. A file whose content is the
+    same as recorded by the previous run is not rewritten so its
+    mtime is preserved, and files recorded by the previous run but
+    not written by this one are deleted.
+
+    The directories known to exist are cached and files are opened
+    relative to cached directory file descriptors so writing a file
+    doesn't stat or resolve its directory again. Nothing is synced
+    unless fsync is True.
+
+    With threads > 0 write() only queues the content and a pool of
+    threads writes it, the queue is bounded so rendering blocks when
+    the threads fall behind. The first error of a thread is raised by
+    the next write(), flush() or finish().
+    '''
+    MANIFEST_NAME = '.gen_srcs_manifest.json'
+
+    # Manifest of shard i of n
+    SHARD_MANIFEST_NAME = '.gen_srcs_manifest.shard{0}of{1}.json'
+
+    # Maximum number of directory file descriptors kept open
+    MAX_DIR_FDS = 64
+
+    # Number of queued files per writer thread
+    QUEUE_DEPTH = 16
+
+    root_path = None
+    manifest_name = None
+    force = False
+    fsync = False
+    threads = 0
+    previous = None
+    entries = None
+    written = 0
+    skipped = 0
+    deleted = 0
+    dirs_created = 0
+    bytes_written = 0
+    __dirs = None
+    __dir_fds = None
+    __lock = None
+    __queue = None
+    __workers = None
+    __error = None
+
+    # Counters merged from the writers of other processes
+    COUNTERS = ('written', 'skipped', 'dirs_created', 'bytes_written')
+
+    # Initializer
+    def __init__(self, root_path, previous=None, force=False, fsync=False,
+                 dirs=None, threads=0, manifest_name=None):
+        self.root_path = os.path.abspath(root_path)
+        self.manifest_name = manifest_name or self.MANIFEST_NAME
+        self.previous = previous if previous else {}
+        self.force = force
+        self.fsync = fsync
+        self.threads = max(0, int(threads))
+        self.entries = {}
+        self.deleted = 0
+        self.__dirs = set(dirs) if dirs else set()
+        self.__dir_fds = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__workers = []
+        self.reset()
+
+    def reset(self):
+        '''
+        Forget the files written so far
+        '''
+        self.entries = {}
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def manifest_path(self):
+        return os.path.join(self.root_path, self.manifest_name)
+
+    def begin(self):
+        '''
+        Create the root directory and load the previous manifest
+        '''
+        self.make_dirs([self.root_path])
+        self.load_manifest()
+
+    def worker_args(self):
+        '''
+        Return the arguments of init_worker for the library pool
+        '''
+        return FileWriter, (self.root_path, self.previous, self.force,
+                            self.fsync, self.__dirs, self.threads)
+
+    def make_dirs(self, dir_paths):
+        '''
+        Create the directories in *dir_paths*, used to create the
+        skeleton of the hierarchy before any file is written.
+        '''
+        for dir_path in dir_paths:
+            self.__make_dirs(os.path.abspath(dir_path))
+
+    def load_manifest(self):
+        '''
+        Load the entries written by the previous run, a missing or
+        unreadable manifest is treated as an empty one.
+        '''
+        try:
+            with open(self.manifest_path(), 'r') as f:
+                self.previous = json.load(f)['files']
+        except (OSError, ValueError, KeyError):
+            self.previous = {}
+
+    def write(self, path, content):
+        '''
+        Write *content* to *path* unless the file already has exactly
+        that content.
+        '''
+        self.write_bytes(path, content.encode())
+
+    def copy(self, src_path, path):
+        with open(src_path, 'rb') as f:
+            self.write_bytes(path, f.read())
+
+    def write_bytes(self, path, data):
+        if not self.threads:
+            self.__write_bytes(path, data)
+            return
+        self.__raise_error()
+        if self.__queue is None:
+            self.__start()
+        self.__queue.put((path, data))
+
+    def __write_bytes(self, path, data):
+        path, rel_path = self.__paths(path)
+        digest = hashlib.sha1(data).hexdigest()
+
+        st = None
+        if not self.force:
+            st = self.__unchanged_stat(path, rel_path, digest, len(data))
+        written = not st
+        if written:
+            fd = self.__open(path)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if self.fsync:
+                    os.fsync(fd)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+
+        with self.__lock:
+            if written:
+                self.written += 1
+                self.bytes_written += len(data)
+            else:
+                self.skipped += 1
+            self.entries[rel_path] = [digest, st.st_size, st.st_mtime_ns]
+
+    def __open(self, path):
+        '''
+        Open *path* for writing relative to the cached file descriptor
+        of its directory.
+        '''
+        with self.__lock:
+            dir_fd, name = self.__dir_entry(path)
+            return os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                           0o666, dir_fd=dir_fd)
+
+    def __start(self):
+        self.__queue = queue.Queue(self.threads * self.QUEUE_DEPTH)
+        for i in range(0, self.threads):
+            worker = threading.Thread(target=self.__drain, daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+
+    def __drain(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    return
+                # After an error the queue is only emptied so that the
+                # renderer doesn't block
+                if self.__error is None:
+                    self.__write_bytes(*item)
+            except BaseException as e:
+                with self.__lock:
+                    if self.__error is None:
+                        self.__error = e
+            finally:
+                self.__queue.task_done()
+
+    def __raise_error(self):
+        error = self.__error
+        if error is not None:
+            # The threads drop the queued files while the error is set
+            self.__stop()
+            self.__error = None
+            raise error
+
+    def __stop(self):
+        '''
+        Stop the writer threads once the queue is empty
+        '''
+        if self.__queue is None:
+            return
+        for worker in self.__workers:
+            self.__queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+        self.__queue = None
+
+    def flush(self):
+        '''
+        Wait until the queued files are written, the first error of a
+        writer thread is raised.
+        '''
+        if self.__queue is not None:
+            self.__queue.join()
+        self.__raise_error()
+
+    def write_chunks(self, path, chunks):
+        '''
+        Write the strings produced by the iterable *chunks* to *path*
+        without holding the whole content in memory. The content is
+        streamed to a temporary file which replaces *path* only if the
+        content changed.
+        '''
+        path, rel_path = self.__paths(path)
+        tmp_path = path + '.tmp'
+
+        h = hashlib.sha1()
+        fd = self.__open(tmp_path)
+        with open(fd, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode()
+                h.update(data)
+                f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(fd)
+            st = os.fstat(fd)
+        digest = h.hexdigest()
+        size = st.st_size
+
+        old_st = None
+        if not self.force:
+            old_st = self.__unchanged_stat(path, rel_path, digest, size)
+        if old_st:
+            os.remove(tmp_path)
+            st = old_st
+        else:
+            os.replace(tmp_path, path)
+
+        with self.__lock:
+            if old_st:
+                self.skipped += 1
+            else:
+                self.written += 1
+                self.bytes_written += size
+            self.entries[rel_path] = [digest, st.st_size, st.st_mtime_ns]
+
+    def __paths(self, path):
+        '''
+        Return the absolute path and the path relative to the root
+        '''
+        if not os.path.isabs(path):
+            path = os.path.abspath(path)
+        if path.startswith(self.root_path + os.sep):
+            return path, path[len(self.root_path) + 1:]
+        return path, os.path.relpath(path, self.root_path)
+
+    def __make_dirs(self, dir_path):
+        # Try mkdir first, a new tree needs no stat at all
+        if dir_path in self.__dirs:
+            return
+        try:
+            os.mkdir(dir_path)
+            self.dirs_created += 1
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            self.__make_dirs(os.path.dirname(dir_path))
+            os.mkdir(dir_path)
+            self.dirs_created += 1
+        self.__dirs.add(dir_path)
+
+    def __dir_entry(self, path):
+        '''
+        Return the file descriptor of the directory of *path*, or None if
+        the platform can't open files relative to one, and the name
+        to open.
+        '''
+        dir_path, name = os.path.split(path)
+        self.__make_dirs(dir_path)
+        if os.open not in os.supports_dir_fd:
+            return None, path
+
+        fd = self.__dir_fds.get(dir_path)
+        if fd is not None:
+            self.__dir_fds.move_to_end(dir_path)
+            return fd, name
+        if len(self.__dir_fds) >= self.MAX_DIR_FDS:
+            old_path, old_fd = self.__dir_fds.popitem(last=False)
+            self.__close_dir(old_fd)
+        fd = os.open(dir_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+        self.__dir_fds[dir_path] = fd
+        return fd, name
+
+    def __close_dir(self, fd):
+        if self.fsync:
+            os.fsync(fd)
+        os.close(fd)
+
+    def close(self):
+        '''
+        Close the cached directory file descriptors, syncing them if
+        fsync is True
+        '''
+        while self.__dir_fds:
+            dir_path, fd = self.__dir_fds.popitem(last=False)
+            self.__close_dir(fd)
+
+    def __unchanged_stat(self, path, rel_path, digest, size):
+        '''
+        Return the stat of *path* if it already has the content with
+        *digest*, otherwise None.
+        '''
+        old = self.previous.get(rel_path)
+        if not old or old[0] != digest:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size != size:
+            return None
+        if st.st_mtime_ns == old[2]:
+            return st
+
+        # Touched since the last run, compare the actual content
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return st if h.hexdigest() == digest else None
+
+    def record(self):
+        '''
+        Return what has been written so far so it can be merged
+        into the writer of another process, the cached directories
+        are closed (and synced) first as a pool process never finishes.
+        '''
+        self.flush()
+        self.close()
+        record = {name: getattr(self, name) for name in self.COUNTERS}
+        record['entries'] = self.entries
+        return record
+
+    def merge(self, record):
+        self.entries.update(record['entries'])
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + record[name])
+
+    @classmethod
+    def read_manifest(cls, root_path):
+        '''
+        Return the manifest in root_path, OSError or ValueError is raised
+        if there is no readable manifest.
+        '''
+        with open(os.path.join(root_path, cls.MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+
+    def finish(self, params=None, edits=None):
+        '''
+        Delete the stale files of the previous run and write the manifest
+        with the parameters and edits the files were generated with.
+        '''
+        self.flush()
+        self.__stop()
+        for rel_path in sorted(set(self.previous) - set(self.entries)):
+            path = os.path.join(self.root_path, rel_path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.deleted += 1
+
+            # Remove the directories left empty
+            dir_path = os.path.dirname(path)
+            while dir_path != self.root_path:
+                try:
+                    os.rmdir(dir_path)
+                except OSError:
+                    break
+                dir_path = os.path.dirname(dir_path)
+
+        with open(self.manifest_path(), 'w') as f:
+            json.dump({'version': 1, 'params': params, 'edits': edits,
+                       'files': self.entries}, f,
+                      sort_keys=True, separators=(',', ':'))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.close()
+
+    def summary(self):
+        return '{0} written, {1} skipped, {2} deleted'.format(
+            self.written, self.skipped, self.deleted)
+
+
+class BufferWriter:
+    '''
+    Keep the generated files in memory, used by the library pool
+    processes of a TarWriter which adds them to the archive.
+    '''
+    root_path = None
+    files = None
+
+    # Initializer
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.files = []
+
+    def reset(self):
+        self.files = []
+
+    def make_dirs(self, dir_paths):
+        pass
+
+    def write(self, path, content):
+        self.write_bytes(path, content.encode())
+
+    def write_bytes(self, path, data):
+        self.files.append((path, data))
+
+    def write_chunks(self, path, chunks):
+        self.write(path, ''.join(chunks))
+
+    def copy(self, src_path, path):
+        with open(src_path, 'rb') as f:
+            self.write_bytes(path, f.read())
+
+    def record(self):
+        return {'files': self.files}
+
+
+class TarWriter:
+    '''
+    Write the generated files into a tar archive instead of the
+    file system. The members are named relative to the parent of
+    root_path so unpacking the archive creates the same tree, manifest
+    included, as a FileWriter would. archive_path - writes the archive
+    to stdout.
+    '''
+    root_path = None
+    archive_path = None
+    compression = None
+    mtime = None
+    entries = None
+    written = 0
+    skipped = 0
+    deleted = 0
+    dirs_created = 0
+    bytes_written = 0
+    __tar = None
+    __dirs = None
+
+    # Initializer
+    def __init__(self, root_path, archive_path, compression=None, mtime=None):
+        self.root_path = os.path.abspath(root_path)
+        self.archive_path = archive_path
+        self.compression = compression if compression else archive_compression(
+            archive_path)
+        self.mtime = int(mtime if mtime is not None else time.time())
+        self.entries = {}
+        self.__dirs = set()
+
+    def begin(self):
+        mode = 'w|' + ('' if self.compression == 'none' else self.compression)
+        if self.archive_path == '-':
+            self.__tar = tarfile.open(fileobj=sys.stdout.buffer, mode=mode)
+        else:
+            self.__tar = tarfile.open(self.archive_path, mode=mode)
+        self.__add_dir(self.root_path)
+
+    def worker_args(self):
+        return BufferWriter, (self.root_path,)
+
+    def make_dirs(self, dir_paths):
+        # Directories are added along with the first file below them
+        pass
+
+    def __arcname(self, path):
+        return os.path.relpath(os.path.abspath(path),
+                               os.path.dirname(self.root_path))
+
+    def __add_dir(self, dir_path):
+        if dir_path in self.__dirs:
+            return
+        if dir_path != self.root_path:
+            self.__add_dir(os.path.dirname(dir_path))
+        self.__dirs.add(dir_path)
+        info = tarfile.TarInfo(self.__arcname(dir_path))
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = self.mtime
+        self.__tar.addfile(info)
+        self.dirs_created += 1
+
+    def __add_file(self, path, f, size, digest):
+        path = os.path.abspath(path)
+        self.__add_dir(os.path.dirname(path))
+        info = tarfile.TarInfo(self.__arcname(path))
+        info.size = size
+        info.mode = 0o644
+        info.mtime = self.mtime
+        self.__tar.addfile(info, f)
+        self.written += 1
+        self.bytes_written += size
+        self.entries[os.path.relpath(path, self.root_path)] = [
+            digest, size, self.mtime * 1000000000]
+
+    def write(self, path, content):
+        self.write_bytes(path, content.encode())
+
+    def write_bytes(self, path, data):
+        self.__add_file(path, io.BytesIO(data), len(data),
+                        hashlib.sha1(data).hexdigest())
+
+    def write_chunks(self, path, chunks):
+        # The size of a member precedes its data, large files are
+        # spooled to a temporary file
+        with tempfile.SpooledTemporaryFile(max_size=64 << 20) as f:
+            h = hashlib.sha1()
+            for chunk in chunks:
+                data = chunk.encode()
+                h.update(data)
+                f.write(data)
+            size = f.tell()
+            f.seek(0)
+            self.__add_file(path, f, size, h.hexdigest())
+
+    def copy(self, src_path, path):
+        with open(src_path, 'rb') as f:
+            self.write_bytes(path, f.read())
+
+    def merge(self, record):
+        for path, data in record['files']:
+            self.write_bytes(path, data)
+
+    def finish(self, params=None, edits=None):
+        manifest = json.dumps({'version': 1, 'params': params, 'edits': edits,
+                               'files': self.entries},
+                              sort_keys=True, separators=(',', ':'))
+        data = manifest.encode()
+        info = tarfile.TarInfo(self.__arcname(
+            os.path.join(self.root_path, FileWriter.MANIFEST_NAME)))
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = self.mtime
+        self.__tar.addfile(info, io.BytesIO(data))
+        self.__tar.close()
+
+    def summary(self):
+        return '{0} written to {1}'.format(
+            self.written,
+            'stdout' if self.archive_path == '-' else self.archive_path)
+
+
+class ShardWriter:
+    '''
+    Pass the build files of the libraries in shard_lib_paths to writer,
+    and the build files which aren't in a library directory only when
+    top is True, so that every file of a sharded tree is written by
+    exactly one shard.
+    '''
+    writer = None
+    lib_paths = None
+    shard_lib_paths = None
+    top = False
+
+    # Initializer
+    def __init__(self, writer, lib_paths, shard_lib_paths, top=False):
+        self.writer = writer
+        self.lib_paths = set(lib_paths)
+        self.shard_lib_paths = set(shard_lib_paths)
+        self.top = top
+
+    def __keep(self, path):
+        dir_path = os.path.dirname(path)
+        if dir_path in self.lib_paths:
+            return dir_path in self.shard_lib_paths
+        return self.top
+
+    def write(self, path, content):
+        if self.__keep(path):
+            self.writer.write(path, content)
+
+    def write_bytes(self, path, data):
+        if self.__keep(path):
+            self.writer.write_bytes(path, data)
+
+    def write_chunks(self, path, chunks):
+        if self.__keep(path):
+            self.writer.write_chunks(path, chunks)
+
+    def copy(self, src_path, path):
+        if self.__keep(path):
+            self.writer.copy(src_path, path)
+
+
+class VerifyWriter:
+    '''
+    Compare the generated files with the files below root_path instead
+    of writing them, to check a tree merged from the shards of
+    --shard. Files which are missing, have a different content or
+    aren't generated are reported. When the tree matches, finish()
+    writes its manifest so it can be regenerated and edited in place
+    like a tree generated by a single run.
+    '''
+    root_path = None
+    entries = None
+    missing = None
+    different = None
+    extra = None
+    written = 0
+    skipped = 0
+    deleted = 0
+    dirs_created = 0
+    bytes_written = 0
+
+    # Initializer
+    def __init__(self, root_path):
+        self.root_path = os.path.abspath(root_path)
+        self.extra = []
+        self.reset()
+
+    def reset(self):
+        self.entries = {}
+        self.missing = []
+        self.different = []
+
+    def begin(self):
+        pass
+
+    def make_dirs(self, dir_paths):
+        pass
+
+    def worker_args(self):
+        return VerifyWriter, (self.root_path,)
+
+    def write(self, path, content):
+        self.write_bytes(path, content.encode())
+
+    def write_bytes(self, path, data):
+        self.__check(path, hashlib.sha1(data).hexdigest())
+
+    def write_chunks(self, path, chunks):
+        h = hashlib.sha1()
+        for chunk in chunks:
+            h.update(chunk.encode())
+        self.__check(path, h.hexdigest())
+
+    def copy(self, src_path, path):
+        with open(src_path, 'rb') as f:
+            self.write_bytes(path, f.read())
+
+    def __check(self, path, digest):
+        rel_path = os.path.relpath(os.path.abspath(path), self.root_path)
+        h = hashlib.sha1()
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+                st = os.fstat(f.fileno())
+        except OSError:
+            self.missing.append(rel_path)
+            return
+        if h.hexdigest() != digest:
+            self.different.append(rel_path)
+            return
+        self.entries[rel_path] = [digest, st.st_size, st.st_mtime_ns]
+
+    def record(self):
+        return {'entries': self.entries, 'missing': self.missing,
+                'different': self.different}
+
+    def merge(self, record):
+        self.entries.update(record['entries'])
+        self.missing.extend(record['missing'])
+        self.different.extend(record['different'])
+
+    def ok(self):
+        return not (self.missing or self.different or self.extra)
+
+    def finish(self, params=None, edits=None):
+        '''
+        Look for the files which aren't generated and write the
+        manifest if the tree matches.
+        '''
+        expected = set(self.entries)
+        expected.update(self.missing, self.different)
+        for dir_path, dir_names, file_names in os.walk(self.root_path):
+            for name in file_names:
+                rel_path = os.path.relpath(os.path.join(dir_path, name),
+                                           self.root_path)
+                if (rel_path not in expected and
+                        not rel_path.startswith('.gen_srcs_manifest')):
+                    self.extra.append(rel_path)
+        self.missing.sort()
+        self.different.sort()
+        self.extra.sort()
+        if not self.ok():
+            return
+
+        with open(os.path.join(self.root_path, FileWriter.MANIFEST_NAME),
+                  'w') as f:
+            json.dump({'version': 1, 'params': params, 'edits': edits,
+                       'files': self.entries}, f,
+                      sort_keys=True, separators=(',', ':'))
+
+    def summary(self):
+        return '{0} verified, {1} missing, {2} different, {3} extra'.format(
+            len(self.entries), len(self.missing), len(self.different),
+            len(self.extra))
+
+
+class PlanWriter:
+    '''
+    Count the files, directories and bytes of the hierarchy instead of
+    writing it, for --plan and the --max-bytes and --max-files guards.
+    The libraries and applications add their files with add() and a
+    size computed without rendering every function, so a plan costs
+    O(libraries) rather than O(functions). The manifest a FileWriter
+    would write is included, its modification times are assumed to
+    have 19 digits like every time between 2001 and 2286.
+    '''
+    CATEGORIES = ('headers', 'sources', 'applications', 'build_files',
+                  'manifest')
+
+    root_path = None
+    manifest_name = None
+    entries = None
+    dirs = None
+    written = 0
+    skipped = 0
+    deleted = 0
+    dirs_created = 0
+    bytes_written = 0
+    manifest_size = 0
+
+    # Initializer
+    def __init__(self, root_path, manifest_name=None):
+        self.root_path = os.path.abspath(root_path)
+        self.manifest_name = manifest_name or FileWriter.MANIFEST_NAME
+        self.dirs = set()
+        self.reset()
+
+    def reset(self):
+        self.entries = {}
+
+    def begin(self):
+        pass
+
+    def worker_args(self):
+        return PlanWriter, (self.root_path, self.manifest_name)
+
+    def make_dirs(self, dir_paths):
+        for dir_path in dir_paths:
+            self.__add_dir(os.path.abspath(dir_path))
+
+    def __add_dir(self, dir_path):
+        while dir_path != self.root_path and dir_path not in self.dirs:
+            self.dirs.add(dir_path)
+            dir_path = os.path.dirname(dir_path)
+
+    def add(self, path, size):
+        '''
+        Add the file *path* of *size* bytes
+        '''
+        if not os.path.isabs(path):
+            path = os.path.abspath(path)
+        self.__add_dir(os.path.dirname(path))
+        if path.startswith(self.root_path + os.sep):
+            rel_path = path[len(self.root_path) + 1:]
+        else:
+            rel_path = os.path.relpath(path, self.root_path)
+        self.entries[rel_path] = size
+
+    def write(self, path, content):
+        self.add(path, len(content.encode()))
+
+    def write_bytes(self, path, data):
+        self.add(path, len(data))
+
+    def write_chunks(self, path, chunks):
+        self.add(path, sum(len(chunk.encode()) for chunk in chunks))
+
+    def copy(self, src_path, path):
+        self.add(path, os.path.getsize(src_path))
+
+    def record(self):
+        return {'entries': self.entries}
+
+    def merge(self, record):
+        self.entries.update(record['entries'])
+
+    def category(self, rel_path):
+        '''
+        Return the category of the file *rel_path* of the plan
+        '''
+        if rel_path.endswith('.h'):
+            return 'headers'
+        if os.path.splitext(rel_path)[1] in [lang['ext'] for lang in
+                                             languages.values()]:
+            if rel_path.startswith('apps' + os.sep):
+                return 'applications'
+            return 'sources'
+        return 'build_files'
+
+    def finish(self, params=None, edits=None):
+        '''
+        Count the manifest, it has a digest, the size and the
+        modification time of every file.
+        '''
+        manifest = json.dumps(
+            {'version': 1, 'params': params, 'edits': edits,
+             'files': {rel_path: ['0' * 40, size, 10 ** 18]
+                       for rel_path, size in self.entries.items()}},
+            sort_keys=True, separators=(',', ':'))
+        self.manifest_size = len(manifest.encode())
+
+    def plan(self):
+        '''
+        Return the number of files, directories and bytes, by category
+        and in total, and the largest file
+        '''
+        categories = {name: {'files': 0, 'bytes': 0}
+                      for name in self.CATEGORIES}
+        for rel_path, size in self.entries.items():
+            category = categories[self.category(rel_path)]
+            category['files'] += 1
+            category['bytes'] += size
+        categories['manifest'] = {'files': 1, 'bytes': self.manifest_size}
+        largest = max(self.entries.items(), key=lambda entry: entry[1],
+                      default=(None, 0))
+        if self.manifest_size > largest[1]:
+            largest = (self.manifest_name, self.manifest_size)
+        return {
+            'files': sum(c['files'] for c in categories.values()),
+            'directories': len(self.dirs),
+            'bytes': sum(c['bytes'] for c in categories.values()),
+            'categories': categories,
+            'largest_file': {'path': largest[0], 'bytes': largest[1]},
+        }
+
+    def summary(self):
+        plan = self.plan()
+        return '{0} files, {1} directories, {2} bytes planned'.format(
+            plan['files'], plan['directories'], plan['bytes'])
+
+
+def archive_compression(archive_path):
+    '''
+    Return the compression implied by the extension of archive_path
+    '''
+    for extensions, compression in ((('.tar.gz', '.tgz'), 'gz'),
+                                    (('.tar.bz2', '.tbz2'), 'bz2'),
+                                    (('.tar.xz', '.txz'), 'xz')):
+        if archive_path.endswith(extensions):
+            return compression
+    return 'none'
+
+
+# The writer of a process in the library pool
+worker_writer = None
+
+
+def init_worker(writer_class, args):
+    global worker_writer
+    worker_writer = writer_class(*args)
+
+
+def create_library(lib):
+    '''
+    Create *lib* in a pool process and return what was written,
+    this is the unit of work handed to the process pool so it must
+    be a module level function.
+    '''
+    worker_writer.reset()
+    lib.create(worker_writer)
+    return worker_writer.record()
+
+
+edit_scenarios = ['touch-main', 'append-main', 'edit-func', 'edit-header',
+                  'add-library', 'remove-library', 'add-function']
+
+edit_parser = argparse.ArgumentParser(
+    prog='gen_srcs.py edit',
+    description='Apply or undo a change to a generated hierarchy, the '
+    'hierarchy is regenerated from the parameters in its manifest so '
+    'only the files affected by the change are written.')
+edit_parser.add_argument('hierarchy_path', help='<file path>')
+edit_parser.add_argument('scenario', choices=edit_scenarios)
+edit_parser.add_argument('--func',
+                         type=int,
+                         default=None,
+                         help='Function changed by edit-func, the default '
+                         'is the last function.')
+edit_parser.add_argument('--library',
+                         type=int,
+                         default=None,
+                         help='Index of the library whose header is changed '
+                         'by edit-header, the default is the last library.')
+edit_parser.add_argument('--undo',
+                         action='store_true',
+                         default=False,
+                         help='Undo the last matching edit.')
+edit_parser.add_argument('-j', '--jobs',
+                         type=int,
+                         default=1,
+                         help='Number of processes used to create the libraries.')
+
+
+def apply_edit(hierarchy_path, scenario, func=None, library=None, undo=False,
+               jobs=1):
+    '''
+    Apply the edit *scenario* to the hierarchy at *hierarchy_path*, or
+    undo the last matching edit, and return the FileWriter of the
+    regeneration. Every edit gets a new id which is part of the code
+    it renders so applying the same scenario twice changes the tree
+    twice. ValueError is raised for an edit which can't be applied.
+    '''
+    manifest = FileWriter.read_manifest(hierarchy_path)
+    params = dict(manifest['params'])
+    edits = list(manifest.get('edits') or [])
+    builder = builders[params.pop('builder')]()
+
+    def hierarchy():
+        return Hierarchy(hierarchy_path, builder=builder, jobs=jobs,
+                         edits=edits, **params)
+
+    lib_count, extra_funcs = hierarchy().shape()
+    last_func = lib_count * params['func_count_per_lib'] + extra_funcs
+
+    if undo:
+        matching = [e for e in edits if e['scenario'] == scenario and
+                    (func is None or e.get('func') == func) and
+                    (library is None or e.get('library') == library)]
+        if not matching:
+            raise ValueError('no {0} edit to undo'.format(scenario))
+        edit = matching[-1]
+        edits.remove(edit)
+    else:
+        edit = {'scenario': scenario,
+                'id': max([e['id'] for e in edits], default=0) + 1}
+        if scenario == 'edit-func':
+            edit['func'] = last_func if func is None else func
+            if not 1 <= edit['func'] <= last_func:
+                raise ValueError('no function func{0}'.format(edit['func']))
+        elif scenario == 'edit-header':
+            edit['library'] = lib_count - 1 if library is None else library
+            if not 0 <= edit['library'] < lib_count:
+                raise ValueError('no library {0}'.format(edit['library']))
+        elif scenario == 'remove-library' and lib_count == 1:
+            raise ValueError('the last library can not be removed')
+        edits.append(edit)
+
+    if scenario == 'touch-main':
+        app_name = 'testapp' if params['app_count'] == 1 else 'testapp000'
+        ext = languages[params.get('lang', 'c')]['ext']
+        main_path = os.path.join(hierarchy_path, 'apps', app_name, 'src',
+                                 'main' + ext)
+        if not undo:
+            edit['mtime_ns'] = os.stat(main_path).st_mtime_ns
+
+    writer = hierarchy().create()
+
+    # The content of main.c is unchanged by touch-main so it is only
+    # touched after the regeneration recorded the edit
+    if scenario == 'touch-main':
+        if undo:
+            os.utime(main_path, ns=(edit['mtime_ns'], edit['mtime_ns']))
+        else:
+            os.utime(main_path)
+    return writer
+
+
+def edit_main(args):
+    '''
+    The edit subcommand
+    '''
+    options = edit_parser.parse_args(args)
+    try:
+        writer = apply_edit(options.hierarchy_path, options.scenario,
+                            func=options.func, library=options.library,
+                            undo=options.undo, jobs=options.jobs)
+    except (OSError, ValueError, KeyError) as e:
+        print('edit: {0}: {1}'.format(options.hierarchy_path, e))
+        return 1
+    print(writer.summary())
+    return 0
+
+
+class BenchTool:
+    '''
+    How to configure, build and clean a generated hierarchy with
+    one build system, the tree is generated with the builder named
+    by gen_builder. Commands are run with the build directory as the
+    working directory and '{src}' replaced by the hierarchy path.
+    ccache is False if the generated build doesn't compile through
+    ccache, the ccache scenario is skipped then.
+    '''
+    # Public fields
+    name = None
+    gen_builder = None
+    labels = None
+    executables = None
+    configure = None
+    build = None
+    clean = None
+    in_source = False
+    ccache = True
+
+    # Initializer
+    def __init__(self, name, gen_builder, labels, executables,
+                 configure, build, clean, in_source=False, ccache=True):
+        self.name = name
+        self.gen_builder = gen_builder
+        self.labels = labels
+        self.executables = executables
+        self.configure = configure
+        self.build = build
+        self.clean = clean
+        self.in_source = in_source
+        self.ccache = ccache
+
+    def missing(self):
+        '''
+        Return the executables needed by the tool that are not installed
+        '''
+        return [exe for exe in self.executables if shutil.which(exe) is None]
+
+
+bench_tools = [
+    BenchTool('meson', 'meson', ('Meson', 'Ninja'), ['meson', 'ninja'],
+              configure=['meson', 'setup', '.', '{src}'],
+              build=['ninja', '-j', '{jobs}'],
+              clean=['ninja', '-t', 'clean']),
+    BenchTool('cmake-ninja', 'cmake', ('CMake', 'Ninja'), ['cmake', 'ninja'],
+              configure=['cmake', '-G', 'Ninja', '{src}'],
+              build=['ninja', '-j', '{jobs}'],
+              clean=['ninja', 'clean']),
+    BenchTool('cmake-make', 'cmake', ('CMake', 'Make'), ['cmake', 'make'],
+              configure=['cmake', '-G', 'Unix Makefiles', '{src}'],
+              build=['make', '-j', '{jobs}'],
+              clean=['make', 'clean']),
+    BenchTool('craftr', 'craftr', ('Craftr', 'Ninja'), ['craftr', 'ninja'],
+              configure=['craftr', '-e'],
+              build=['ninja', '-j', '{jobs}'],
+              clean=['ninja', '-t', 'clean'],
+              in_source=True),
+    BenchTool('ninja', 'ninja', ('gen_srcs', 'Ninja'), ['ninja'],
+              configure=None,
+              build=['ninja', '-j', '{jobs}'],
+              clean=['ninja', '-t', 'clean'],
+              in_source=True, ccache=False),
+    BenchTool('make', 'make', ('gen_srcs', 'Make'), ['make'],
+              configure=None,
+              build=['make', '-j', '{jobs}'],
+              clean=['make', 'clean'],
+              in_source=True, ccache=False),
+]
+
+# The rows of the result table, a row without a key is a heading
+bench_rows = [
+    ('configure', 'Generate build system'),
+    (None, 'clear cache'),
+    ('clean_build', 'clean build'),
+    ('noop', 'do nothing'),
+    ('clean', 'clean targets'),
+    ('ccache_build', 'clean build with ccache'),
+    (None, 'Add a printf to end of main'),
+    ('main_changed', 'build with main changed'),
+    (None, 'Edit last function.'),
+    ('func_changed', 'build with {last_func} changed'),
+]
+
+bench_parser = argparse.ArgumentParser(
+    prog='gen_srcs.py bench',
+    description='Generate a hierarchy for each build system and time '
+    'configuring and building it.')
+bench_parser.add_argument('hierarchy_path', help='<file path>')
+bench_parser.add_argument('library_count', type=int, help='<Library count>')
+bench_parser.add_argument('function_count_per_library', type=int,
+                          help='<function count per library>')
+bench_parser.add_argument('--tools',
+                          default=','.join(t.name for t in bench_tools),
+                          help='Comma separated build systems to benchmark, '
+                          'the default is all of them.')
+bench_parser.add_argument('-r', '--repeat',
+                          type=int,
+                          default=3,
+                          help='Number of times each scenario is run.')
+bench_parser.add_argument('-j', '--build-jobs',
+                          type=int,
+                          default=os.cpu_count() or 1,
+                          help='Parallel jobs passed to ninja and make.')
+bench_parser.add_argument('--json',
+                          dest='json_path',
+                          default=None,
+                          help='Write the results as JSON to this file.')
+bench_parser.add_argument('--table',
+                          dest='table_path',
+                          default=None,
+                          help='Write the table to this file instead of stdout.')
+bench_parser.add_argument('--db',
+                          dest='db_path',
+                          default=None,
+                          help='Append the results to this SQLite database.')
+
+
+class Benchmark:
+    '''
+    Generate a hierarchy for each build system and time the scenarios
+    of perf.ascii.txt. Every scenario is run repeat times, each
+    repetition starts from a freshly generated tree and build
+    directory.
+    '''
+    # Public fields
+    bench_path = None
+    lib_count = None
+    func_count_per_lib = None
+    repeat = 3
+    build_jobs = 1
+    results = None
+
+    # Initializer
+    def __init__(self, bench_path, lib_count, func_count_per_lib, repeat=3,
+                 build_jobs=1):
+        self.bench_path = os.path.abspath(bench_path)
+        self.lib_count = lib_count
+        self.func_count_per_lib = func_count_per_lib
+        self.repeat = repeat
+        self.build_jobs = build_jobs
+        self.results = {}
+
+    def last_func(self):
+        return 'func{0}'.format(self.lib_count * self.func_count_per_lib)
+
+    def __run(self, tool, cmd, src_path, build_path, ccache=False):
+        '''
+        Run one of the tool's commands and return its wall time
+        '''
+        cmd = [arg.format(src=src_path, jobs=self.build_jobs) for arg in cmd]
+        env = dict(os.environ)
+        if not ccache:
+            env['CCACHE_DISABLE'] = '1'
+        start = time.perf_counter()
+        p = subprocess.run(cmd, cwd=build_path, env=env,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        elapsed = time.perf_counter() - start
+        if p.returncode != 0:
+            raise RuntimeError('{0}: {1} failed:\n{2}'.format(
+                tool.name, ' '.join(cmd), p.stdout.decode(errors='replace')))
+        return elapsed
+
+    def run_tool(self, tool):
+        '''
+        Run all of the scenarios for *tool* and return the list of times
+        of each scenario.
+        '''
+        times = {}
+
+        def record(key, seconds):
+            times.setdefault(key, []).append(seconds)
+
+        src_path = os.path.join(self.bench_path, tool.name)
+        for _ in range(self.repeat):
+            shutil.rmtree(src_path, ignore_errors=True)
+            start = time.perf_counter()
+            hierarchy = Hierarchy(src_path, self.lib_count,
+                                  self.func_count_per_lib,
+                                  builders[tool.gen_builder](), force=True)
+            hierarchy.create()
+            record('generate', time.perf_counter() - start)
+
+            build_path = src_path if tool.in_source else src_path + '-build'
+            if not tool.in_source:
+                shutil.rmtree(build_path, ignore_errors=True)
+                os.makedirs(build_path)
+
+            def run(cmd, ccache=False):
+                return self.__run(tool, cmd, src_path, build_path, ccache)
+
+            if tool.configure:
+                record('configure', run(tool.configure))
+            record('clean_build', run(tool.build))
+            record('noop', run(tool.build))
+            record('clean', run(tool.clean))
+
+            if tool.ccache and shutil.which('ccache'):
+                # Fill the cache, then time a clean build that hits it
+                run(tool.build, ccache=True)
+                run(tool.clean)
+                record('ccache_build', run(tool.build, ccache=True))
+            else:
+                run(tool.build)
+
+            for key, scenario in (('main_changed', 'append-main'),
+                                  ('func_changed', 'edit-func')):
+                apply_edit(src_path, scenario)
+                record(key, run(tool.build))
+                apply_edit(src_path, scenario, undo=True)
+                run(tool.build)
+
+        return times
+
+    def run(self, tools):
+        '''
+        Benchmark each of *tools*, tools which are not installed
+        are skipped. Returns the results.
+        '''
+        for tool in tools:
+            missing = tool.missing()
+            if missing:
+                print('bench: skipping {0}, not installed: {1}'.format(
+                    tool.name, ', '.join(missing)), file=sys.stderr)
+                continue
+            print('bench: {0}'.format(tool.name), file=sys.stderr)
+            self.results[tool.name] = {
+                key: summarize(values)
+                for key, values in self.run_tool(tool).items()}
+        return self.results
+
+    def as_json(self):
+        return {
+            'params': {
+                'library_count': self.lib_count,
+                'function_count_per_library': self.func_count_per_lib,
+                'repeat': self.repeat,
+                'build_jobs': self.build_jobs,
+            },
+            'tools': {tool.name: list(tool.labels) for tool in bench_tools
+                      if tool.name in self.results},
+            'results': self.results,
+        }
+
+
+def summarize(values):
+    '''
+    Return the median, min and standard deviation of a list of times
+    '''
+    return {
+        'times': values,
+        'median': statistics.median(values),
+        'min': min(values),
+        'stddev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return '{0}m{1:.3f}s'.format(int(minutes), seconds)
+
+
+def render_table(bench, rows=None):
+    '''
+    Render the medians of the results in *bench*, the dictionary
+    returned by Benchmark.as_json(), in the layout of perf.ascii.txt.
+    *rows* are the keys and labels of the rows, bench_rows by default.
+    '''
+    names = list(bench['results'])
+    labels = [bench['tools'][name] for name in names]
+    last_func = 'func{0}'.format(bench['params']['library_count'] *
+                                 bench['params']['function_count_per_library'])
+
+    def row(label, cells):
+        return ' {0:<32}|{1}\n'.format(
+            label, ''.join(' {0:<10}|'.format(cell) for cell in cells))
+
+    rule = ' ' + '-' * (33 + 12 * len(names)) + '\n'
+    out = [rule,
+           row('Operation', [top for top, bottom in labels]),
+           row('', [bottom for top, bottom in labels]),
+           rule]
+    for key, label in rows or bench_rows:
+        cells = []
+        for name in names:
+            result = bench['results'][name].get(key) if key else None
+            cells.append(format_duration(result['median']) if result else '')
+        out.append(row(label.format(last_func=last_func), cells))
+    out.append(rule)
+    return ''.join(out)
+
+
+def bench_main(args):
+    '''
+    The bench subcommand
+    '''
+    options = bench_parser.parse_args(args)
+
+    tools = []
+    for name in options.tools.split(','):
+        for tool in bench_tools:
+            if tool.name == name:
+                tools.append(tool)
+                break
+        else:
+            print("bench: unknown tool '{0}' must be one of {1}".format(
+                name, ', '.join(t.name for t in bench_tools)))
+            return 1
+
+    if options.repeat < 1 or options.library_count < 1:
+        print('bench: repeat and library_count must be >= 1')
+        return 1
+
+    benchmark = Benchmark(options.hierarchy_path, options.library_count,
+                          options.function_count_per_library,
+                          repeat=options.repeat,
+                          build_jobs=options.build_jobs)
+    benchmark.run(tools)
+    results = benchmark.as_json()
+
+    if options.json_path:
+        with open(options.json_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if options.db_path:
+        executables = ['cc'] + [exe for tool in tools if tool.name in
+                                benchmark.results for exe in tool.executables]
+        try:
+            store = ResultsStore(options.db_path)
+        except RuntimeError as e:
+            print('bench: {0}'.format(e))
+            return 1
+        store.add_run('bench', results['params'],
+                      {name: {key: result['times']
+                              for key, result in scenarios.items()}
+                       for name, scenarios in benchmark.results.items()},
+                      versions=tool_versions(sorted(set(executables))))
+        store.close()
+
+    table = render_table(results)
+    if options.table_path:
+        with open(options.table_path, 'w') as f:
+            f.write(table)
+    else:
+        sys.stdout.write(table)
+    return 0
+
+
+measure_parser = argparse.ArgumentParser(
+    prog='gen_srcs.py measure',
+    description='Generate a hierarchy for each build system and library '
+    'count and measure the CPU time, memory, context switches and processes '
+    'of configuring and building it.')
+measure_parser.add_argument('hierarchy_path', help='<file path>')
+measure_parser.add_argument('library_counts',
+                            help='<comma separated library counts>')
+measure_parser.add_argument('function_count_per_library', type=int,
+                            help='<function count per library>')
+measure_parser.add_argument('--tools',
+                            default=','.join(t.name for t in bench_tools),
+                            help='Comma separated build systems to measure, '
+                            'the default is all of them.')
+measure_parser.add_argument('-j', '--build-jobs',
+                            type=int,
+                            default=os.cpu_count() or 1,
+                            help='Parallel jobs passed to ninja and make.')
+measure_parser.add_argument('--interval',
+                            type=float,
+                            default=0.05,
+                            help='Seconds between two samples of the memory '
+                            'and processes of a command.')
+measure_parser.add_argument('--json',
+                            dest='json_path',
+                            default=None,
+                            help='Write the results, samples included, as '
+                            'JSON to this file.')
+
+
+def forks():
+    '''
+    Return the number of processes created since boot, None if it
+    isn't known
+    '''
+    try:
+        with open('/proc/stat', 'r') as f:
+            for line in f:
+                if line.startswith('processes '):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def process_tree(root_pid):
+    '''
+    Return the resident set size in bytes of *root_pid* and of each of
+    its descendants, read from /proc
+    '''
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children = {}
+    rss = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{0}/stat'.format(name), 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and parentheses
+        fields = stat[stat.rindex(')') + 2:].split()
+        pid = int(name)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+
+    tree = {}
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        if pid in rss:
+            tree[pid] = rss[pid]
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def measure_command(cmd, cwd, env=None, interval=0.05):
+    '''
+    Run *cmd* and return its wall time, the rusage of the command and
+    of the descendants it waited for, and, where /proc is available,
+    the peak resident set size of the process tree, the processes seen
+    and created and samples of [seconds, bytes, processes] every
+    *interval* seconds. The processes created are counted system wide
+    so other activity of the machine is included.
+    '''
+    polling = os.path.isdir('/proc')
+    forks_before = forks()
+    start = time.perf_counter()
+    p = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    output = []
+    reader = threading.Thread(target=lambda: output.append(p.stdout.read()))
+    reader.start()
+
+    samples = []
+    seen = set()
+    peak_rss = 0
+    usage = None
+    while True:
+        if hasattr(os, 'wait4'):
+            pid, status, usage = os.wait4(p.pid, os.WNOHANG)
+            if pid:
+                p.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                                else -os.WTERMSIG(status))
+                break
+        elif p.poll() is not None:
+            break
+        if polling:
+            tree = process_tree(p.pid)
+            seen.update(tree)
+            total = sum(tree.values())
+            peak_rss = max(peak_rss, total)
+            samples.append([round(time.perf_counter() - start, 3), total,
+                            len(tree)])
+        time.sleep(interval)
+    elapsed = time.perf_counter() - start
+    forks_after = forks()
+    reader.join()
+    p.stdout.close()
+    if p.returncode != 0:
+        raise RuntimeError('{0} failed:\n{1}'.format(
+            ' '.join(cmd), b''.join(output).decode(errors='replace')))
+
+    result = {
+        'wall': elapsed,
+        'user': None,
+        'sys': None,
+        'max_rss': None,
+        'voluntary_switches': None,
+        'involuntary_switches': None,
+        'peak_tree_rss': peak_rss if polling else None,
+        'processes_seen': len(seen) if polling else None,
+        'processes_created': (forks_after - forks_before
+                              if forks_before is not None else None),
+        'samples': samples,
+    }
+    if usage is not None:
+        result.update({
+            'user': usage.ru_utime,
+            'sys': usage.ru_stime,
+            'voluntary_switches': usage.ru_nvcsw,
+            'involuntary_switches': usage.ru_nivcsw,
+        })
+        # ru_maxrss is in KiB, the largest of the processes. A forked
+        # process starts with the peak of this one before it execs, so
+        # a smaller value only tells that the command used less.
+        if resource and (usage.ru_maxrss >
+                         resource.getrusage(resource.RUSAGE_SELF).ru_maxrss):
+            result['max_rss'] = usage.ru_maxrss * 1024
+    return result
+
+
+class Measurement:
+    '''
+    Generate a hierarchy for each build system and library count and
+    measure configuring it, a clean build and a build which does
+    nothing with measure_command().
+    '''
+    # Public fields
+    measure_path = None
+    lib_counts = None
+    func_count_per_lib = None
+    build_jobs = 1
+    interval = 0.05
+    results = None
+
+    # Initializer
+    def __init__(self, measure_path, lib_counts, func_count_per_lib,
+                 build_jobs=1, interval=0.05):
+        self.measure_path = os.path.abspath(measure_path)
+        self.lib_counts = lib_counts
+        self.func_count_per_lib = func_count_per_lib
+        self.build_jobs = build_jobs
+        self.interval = interval
+        self.results = {}
+
+    def run_tool(self, tool, lib_count):
+        '''
+        Return the measurements of each step of *tool* for a hierarchy
+        of *lib_count* libraries
+        '''
+        src_path = os.path.join(self.measure_path, tool.name)
+        shutil.rmtree(src_path, ignore_errors=True)
+        Hierarchy(src_path, lib_count, self.func_count_per_lib,
+                  builders[tool.gen_builder](), force=True).create()
+        build_path = src_path if tool.in_source else src_path + '-build'
+        if not tool.in_source:
+            shutil.rmtree(build_path, ignore_errors=True)
+            os.makedirs(build_path)
+
+        env = dict(os.environ)
+        env['CCACHE_DISABLE'] = '1'
+        steps = [('clean_build', tool.build), ('noop', tool.build)]
+        if tool.configure:
+            steps.insert(0, ('configure', tool.configure))
+        results = {}
+        for key, cmd in steps:
+            cmd = [arg.format(src=src_path, jobs=self.build_jobs)
+                   for arg in cmd]
+            try:
+                results[key] = measure_command(cmd, build_path, env,
+                                               self.interval)
+            except RuntimeError as e:
+                raise RuntimeError('{0}: {1}'.format(tool.name, e))
+        return results
+
+    def run(self, tools):
+        '''
+        Measure each of *tools* for each library count, tools which
+        are not installed are skipped. Returns the results.
+        '''
+        for tool in tools:
+            missing = tool.missing()
+            if missing:
+                print('measure: skipping {0}, not installed: {1}'.format(
+                    tool.name, ', '.join(missing)), file=sys.stderr)
+                continue
+            for lib_count in self.lib_counts:
+                print('measure: {0} {1}'.format(tool.name, lib_count),
+                      file=sys.stderr)
+                self.results.setdefault(tool.name, {})[str(lib_count)] = \
+                    self.run_tool(tool, lib_count)
+        return self.results
+
+    def as_json(self):
+        return {
+            'params': {
+                'library_counts': self.lib_counts,
+                'function_count_per_library': self.func_count_per_lib,
+                'build_jobs': self.build_jobs,
+                'interval': self.interval,
+            },
+            'tools': {tool.name: list(tool.labels) for tool in bench_tools
+                      if tool.name in self.results},
+            'results': self.results,
+        }
+
+
+def format_bytes(size):
+    if size is None:
+        return '-'
+    return '{0:.1f}M'.format(size / float(1 << 20))
+
+
+def render_measurements(measurements):
+    '''
+    Render the peak memory and the CPU time of each step in
+    *measurements*, the dictionary returned by Measurement.as_json(),
+    one row per step and library count and one column per tool.
+    '''
+    names = list(measurements['results'])
+    labels = [measurements['tools'][name] for name in names]
+
+    def row(label, cells):
+        return ' {0:<28}|{1}\n'.format(
+            label, ''.join(' {0:<18}|'.format(cell) for cell in cells))
+
+    rule = ' ' + '-' * (29 + 20 * len(names)) + '\n'
+    out = [rule,
+           row('Step', [top for top, bottom in labels]),
+           row('peak RSS, CPU, procs', [bottom for top, bottom in labels]),
+           rule]
+    for key, label in (('configure', 'Generate build system'),
+                       ('clean_build', 'clean build'),
+                       ('noop', 'do nothing')):
+        for lib_count in measurements['params']['library_counts']:
+            cells = []
+            for name in names:
+                result = measurements['results'][name][str(lib_count)].get(key)
+                if not result:
+                    cells.append('')
+                    continue
+                cpu = '-'
+                if result['user'] is not None:
+                    cpu = '{0:.2f}s'.format(result['user'] + result['sys'])
+                procs = result['processes_created']
+                cells.append('{0} {1} {2}'.format(
+                    format_bytes(result['peak_tree_rss'] or None), cpu,
+                    '-' if procs is None else procs))
+            out.append(row('{0} {1}'.format(label, lib_count), cells))
+    out.append(rule)
+    return ''.join(out)
+
+
+def measure_main(args):
+    '''
+    The measure subcommand
+    '''
+    options = measure_parser.parse_args(args)
+
+    tools = []
+    for name in options.tools.split(','):
+        for tool in bench_tools:
+            if tool.name == name:
+                tools.append(tool)
+                break
+        else:
+            print("measure: unknown tool '{0}' must be one of {1}".format(
+                name, ', '.join(t.name for t in bench_tools)))
+            return 1
+
+    try:
+        lib_counts = [int(count) for count in options.library_counts.split(',')]
+    except ValueError:
+        lib_counts = []
+    if not lib_counts or min(lib_counts) < 1 or options.interval <= 0:
+        print('measure: library counts must be >= 1 and interval > 0')
+        return 1
+
+    measurement = Measurement(options.hierarchy_path, lib_counts,
+                              options.function_count_per_library,
+                              build_jobs=options.build_jobs,
+                              interval=options.interval)
+    try:
+        measurement.run(tools)
+    except (OSError, RuntimeError) as e:
+        print('measure: {0}'.format(e))
+        return 1
+    results = measurement.as_json()
+
+    if options.json_path:
+        with open(options.json_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    sys.stdout.write(render_measurements(results))
+    return 0
+
+
+class ResultsStore:
+    '''
+    Append the results of the generator and of bench to a SQLite
+    database so runs can be compared later. A run has its kind,
+    generate or bench, its parameters, the versions of the tools and
+    the host as JSON, and every time measured is a row of results.
+    '''
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS runs ('
+        'id INTEGER PRIMARY KEY, created REAL, kind TEXT, '
+        'params TEXT, versions TEXT, host TEXT)',
+        'CREATE TABLE IF NOT EXISTS results ('
+        'run_id INTEGER REFERENCES runs(id), tool TEXT, scenario TEXT, '
+        'seconds REAL)',
+        'CREATE INDEX IF NOT EXISTS results_run ON results(run_id)',
+    ]
+
+    db_path = None
+    __db = None
+
+    # Initializer
+    def __init__(self, db_path):
+        if sqlite3 is None:
+            raise RuntimeError('the sqlite3 module is not available')
+        self.db_path = db_path
+        try:
+            self.__db = sqlite3.connect(db_path)
+            with self.__db:
+                for statement in self.SCHEMA:
+                    self.__db.execute(statement)
+        except sqlite3.Error as e:
+            raise RuntimeError('{0}: {1}'.format(db_path, e))
+
+    def close(self):
+        self.__db.close()
+
+    @staticmethod
+    def host():
+        return {
+            'node': platform.node(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+        }
+
+    def add_run(self, kind, params, times, versions=None):
+        '''
+        Add a run of *kind* and return its id, *times* maps each tool
+        to the list of times of each of its scenarios
+        '''
+        with self.__db:
+            cursor = self.__db.execute(
+                'INSERT INTO runs (created, kind, params, versions, host) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (time.time(), kind, json.dumps(params, sort_keys=True),
+                 json.dumps(versions or {}, sort_keys=True),
+                 json.dumps(self.host(), sort_keys=True)))
+            run_id = cursor.lastrowid
+            self.__db.executemany(
+                'INSERT INTO results (run_id, tool, scenario, seconds) '
+                'VALUES (?, ?, ?, ?)',
+                [(run_id, tool, scenario, seconds)
+                 for tool, scenarios in times.items()
+                 for scenario, values in scenarios.items()
+                 for seconds in values])
+        return run_id
+
+    def runs(self):
+        '''
+        Return the runs, oldest first, as dictionaries
+        '''
+        rows = self.__db.execute(
+            'SELECT id, created, kind, params, versions, host FROM runs '
+            'ORDER BY id')
+        return [{'id': row[0], 'created': row[1], 'kind': row[2],
+                 'params': json.loads(row[3]), 'versions': json.loads(row[4]),
+                 'host': json.loads(row[5])} for row in rows]
+
+    def select(self, selector):
+        '''
+        Return the runs matched by *selector*: a run id, A..B for the
+        runs from id A to id B, last or last~N for the Nth run before
+        the last one, or TOOL@VERSION for every run made with that
+        version of a tool.
+        '''
+        runs = self.runs()
+        if '..' in selector:
+            first, last = selector.split('..', 1)
+            try:
+                first, last = int(first), int(last)
+            except ValueError:
+                return []
+            return [run for run in runs if first <= run['id'] <= last]
+        if selector == 'last' or selector.startswith('last~'):
+            try:
+                back = int(selector[5:]) if selector != 'last' else 0
+            except ValueError:
+                return []
+            if not 0 <= back < len(runs):
+                return []
+            return [runs[-1 - back]]
+        if '@' in selector:
+            tool, version = selector.split('@', 1)
+            return [run for run in runs
+                    if run['versions'].get(tool) == version]
+        return [run for run in runs if str(run['id']) == selector]
+
+    def times(self, runs):
+        '''
+        Return the times of *runs* merged, a list for each scenario
+        of each tool
+        '''
+        times = {}
+        for run in runs:
+            rows = self.__db.execute(
+                'SELECT tool, scenario, seconds FROM results WHERE run_id = ? '
+                'ORDER BY rowid', (run['id'],))
+            for tool, scenario, seconds in rows:
+                times.setdefault(tool, {}).setdefault(scenario, []).append(
+                    seconds)
+        return times
+
+
+def tool_versions(executables):
+    '''
+    Return the version printed by --version of each of *executables*
+    which is installed
+    '''
+    versions = {}
+    for exe in executables:
+        if shutil.which(exe) is None:
+            continue
+        try:
+            p = subprocess.run([exe, '--version'], stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        output = p.stdout.decode(errors='replace')
+        match = re.search(r'\d+(\.\d+)+', output)
+        if match:
+            versions[exe] = match.group(0)
+        elif output.strip():
+            versions[exe] = output.splitlines()[0].strip()
+    return versions
+
+
+def incomplete_beta(a, b, x):
+    '''
+    Return the regularized incomplete beta function I_x(a, b),
+    evaluated with Lentz's algorithm for its continued fraction
+    '''
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    if x > (a + 1.0) / (a + b + 2.0):
+        return 1.0 - incomplete_beta(b, a, 1.0 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+                     a * math.log(x) + b * math.log(1.0 - x)) / a
+    tiny = 1e-300
+    f, c, d = 1.0, 1.0, 0.0
+    for i in range(0, 400):
+        m = i // 2
+        if i == 0:
+            numerator = 1.0
+        elif i % 2 == 0:
+            numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        else:
+            numerator = -((a + m) * (a + b + m) * x /
+                          ((a + 2 * m) * (a + 2 * m + 1)))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        f *= c * d
+        if abs(1.0 - c * d) < 1e-12:
+            break
+    return front * (f - 1.0)
+
+
+def welch_test(base, new):
+    '''
+    Return the two sided p-value of Welch's t-test of the means of the
+    times *base* and *new*, None when either has fewer than two times
+    '''
+    if len(base) < 2 or len(new) < 2:
+        return None
+    var_base = statistics.variance(base) / len(base)
+    var_new = statistics.variance(new) / len(new)
+    diff = statistics.mean(new) - statistics.mean(base)
+    if var_base + var_new == 0:
+        return 1.0 if diff == 0 else 0.0
+    t = diff / math.sqrt(var_base + var_new)
+    df = (var_base + var_new) ** 2 / (var_base ** 2 / (len(base) - 1) +
+                                      var_new ** 2 / (len(new) - 1))
+    return incomplete_beta(df / 2.0, 0.5, df / (df + t * t))
+
+
+compare_parser = argparse.ArgumentParser(
+    prog='gen_srcs.py compare',
+    description='List the runs in a results database, render the table of '
+    'a run or compare two runs.')
+compare_parser.add_argument('db_path', help='<results database>')
+compare_parser.add_argument('runs',
+                            nargs='*',
+                            metavar='RUN',
+                            help='A run id, A..B for the runs with ids A to B, '
+                            'last, last~N or TOOL@VERSION for all of the runs '
+                            'made with that version of a tool, the times of '
+                            'the runs are merged. One RUN renders its table, '
+                            'two compare the second with the first.')
+compare_parser.add_argument('--alpha',
+                            type=float,
+                            default=0.05,
+                            help="Significance level of Welch's t-test.")
+compare_parser.add_argument('--threshold',
+                            type=float,
+                            default=5.0,
+                            metavar='PERCENT',
+                            help='Smallest change of the median which is '
+                            'flagged.')
+
+
+def compare(base, new, alpha=0.05, threshold=5.0):
+    '''
+    Return the comparison of the times of each scenario of each tool
+    in both *base* and *new*, the dictionaries returned by
+    ResultsStore.times(). A change of the median of at least
+    *threshold* percent with a p-value below *alpha* is flagged as a
+    regression or an improvement.
+    '''
+    comparison = {}
+    for tool in base:
+        for scenario, base_times in base[tool].items():
+            new_times = new.get(tool, {}).get(scenario)
+            if not new_times:
+                continue
+            base_median = statistics.median(base_times)
+            new_median = statistics.median(new_times)
+            change = ((new_median - base_median) / base_median * 100
+                      if base_median else 0.0)
+            p = welch_test(base_times, new_times)
+            flag = None
+            if p is not None and p < alpha and abs(change) >= threshold:
+                flag = 'regression' if change > 0 else 'improvement'
+            comparison.setdefault(tool, {})[scenario] = {
+                'base': base_median, 'new': new_median, 'change': change,
+                'p': p, 'flag': flag}
+    return comparison
+
+
+def stored_rows(times):
+    '''
+    Return the rows of the table of *times*, the scenarios of bench in
+    their order followed by the others, the phases of the generator
+    '''
+    scenarios = []
+    for tool_times in times.values():
+        for scenario in tool_times:
+            if scenario not in scenarios:
+                scenarios.append(scenario)
+    keys = [key for key, label in bench_rows if key]
+    if any(scenario in keys for scenario in scenarios):
+        return bench_rows + [(scenario, scenario) for scenario in scenarios
+                             if scenario not in keys]
+    return [(scenario, scenario) for scenario in scenarios]
+
+
+def render_comparison(comparison, rows, last_func):
+    '''
+    Render the medians of the base and new runs and their change for
+    each tool in the layout of perf.ascii.txt, flagged changes are
+    marked with R for a regression and I for an improvement.
+    '''
+    names = list(comparison)
+
+    def row(label, cells):
+        return ' {0:<32}|{1}\n'.format(
+            label, ''.join(' {0:<30}|'.format(cell) for cell in cells))
+
+    rule = ' ' + '-' * (33 + 32 * len(names)) + '\n'
+    out = [rule, row('Operation', names),
+           row('', ['base -> new, change' for name in names]), rule]
+    for key, label in rows:
+        cells = []
+        for name in names:
+            result = comparison[name].get(key) if key else None
+            if not result:
+                cells.append('')
+                continue
+            mark = {'regression': ' R', 'improvement': ' I'}.get(
+                result['flag'], '')
+            cells.append('{0} -> {1} {2:+.1f}%{3}'.format(
+                format_duration(result['base']),
+                format_duration(result['new']), result['change'], mark))
+        out.append(row(label.format(last_func=last_func), cells))
+    out.append(rule)
+    return ''.join(out)
+
+
+def stored_table(runs, times):
+    '''
+    Return the dictionary render_table() takes for the merged *runs*
+    '''
+    params = runs[-1]['params']
+    lib_count = params.get('library_count', params.get('lib_count', 0))
+    func_count = params.get('function_count_per_library',
+                            params.get('func_count_per_lib', 0))
+    labels = {tool.name: list(tool.labels) for tool in bench_tools}
+    return {
+        'params': {'library_count': lib_count,
+                   'function_count_per_library': func_count},
+        'tools': {name: labels.get(name, [name, 'gen_srcs'])
+                  for name in times},
+        'results': {name: {key: summarize(values)
+                           for key, values in scenarios.items()}
+                    for name, scenarios in times.items()},
+    }
+
+
+def compare_main(args):
+    '''
+    The compare subcommand
+    '''
+    options = compare_parser.parse_args(args)
+    if len(options.runs) > 2:
+        print('compare: at most two runs can be compared')
+        return 1
+
+    try:
+        store = ResultsStore(options.db_path)
+    except RuntimeError as e:
+        print('compare: {0}'.format(e))
+        return 1
+    try:
+        if not options.runs:
+            for run in store.runs():
+                params = run['params']
+                print('{0:>5} {1} {2:<8} {3} {4}x{5} {6}'.format(
+                    run['id'],
+                    time.strftime('%Y-%m-%d %H:%M:%S',
+                                  time.localtime(run['created'])),
+                    run['kind'],
+                    params.get('builder', ''),
+                    params.get('library_count', params.get('lib_count')),
+                    params.get('function_count_per_library',
+                               params.get('func_count_per_lib')),
+                    ' '.join('{0}@{1}'.format(tool, version) for tool, version
+                             in sorted(run['versions'].items()))))
+            return 0
+
+        selected = []
+        for selector in options.runs:
+            runs = store.select(selector)
+            if not runs:
+                print("compare: no run matches '{0}'".format(selector))
+                return 1
+            selected.append((runs, store.times(runs)))
+    finally:
+        store.close()
+
+    runs, times = selected[-1]
+    table = stored_table(runs, times)
+    last_func = 'func{0}'.format(table['params']['library_count'] *
+                                 table['params']['function_count_per_library'])
+    if len(selected) == 1:
+        sys.stdout.write(render_table(table, stored_rows(times)))
+        return 0
+
+    (base_runs, base), (new_runs, new) = selected
+    if base_runs[-1]['params'] != new_runs[-1]['params']:
+        print('compare: the runs have different parameters', file=sys.stderr)
+    comparison = compare(base, new, alpha=options.alpha,
+                         threshold=options.threshold)
+    sys.stdout.write(render_comparison(comparison, stored_rows(new),
+                                       last_func))
+    for tool, scenarios in sorted(comparison.items()):
+        for scenario, result in sorted(scenarios.items()):
+            if result['flag']:
+                print('{0}: {1} {2} {3:+.1f}% (p={4:.3g})'.format(
+                    result['flag'], tool, scenario, result['change'],
+                    result['p']))
+    return 0
+
+
+calibrate_parser = argparse.ArgumentParser(
+    prog='gen_srcs.py calibrate',
+    description='Compile sample libraries of each body profile and report '
+    'the compile time per function.')
+calibrate_parser.add_argument('--profiles',
+                              default=','.join(body_profiles[:-1]),
+                              help='Comma separated body profiles, the '
+                              'default is all of them.')
+calibrate_parser.add_argument('--body-size',
+                              type=int,
+                              default=1,
+                              help='Units of work in each function body.')
+calibrate_parser.add_argument('--functions',
+                              type=int,
+                              default=200,
+                              help='Number of functions of the sample '
+                              'library.')
+calibrate_parser.add_argument('--lang',
+                              choices=sorted(languages),
+                              default='c',
+                              help='Language of the sample libraries.')
+calibrate_parser.add_argument('--cc',
+                              default=None,
+                              help='Compiler, the default is $CC or cc, $CXX '
+                              'or c++ for cpp.')
+calibrate_parser.add_argument('--cflags',
+                              default=None,
+                              help='Flags passed to the compiler, the default '
+                              'is $CFLAGS, $CXXFLAGS for cpp.')
+calibrate_parser.add_argument('-r', '--repeat',
+                              type=int,
+                              default=3,
+                              help='Number of times each sample is compiled.')
+calibrate_parser.add_argument('--seed',
+                              type=int,
+                              default=0,
+                              help='Seed of the constants of the bodies.')
+calibrate_parser.add_argument('--target',
+                              type=float,
+                              default=None,
+                              metavar='SECONDS',
+                              help='Also report the number of functions '
+                              'which take SECONDS to compile one after the '
+                              'other.')
+calibrate_parser.add_argument('--json',
+                              dest='json_path',
+                              default=None,
+                              help='Write the results as JSON to this file.')
+
+
+def calibrate(work_path, profile, func_count, body_size=1, cc='cc',
+              cflags=None, repeat=3, seed=0, lang='c'):
+    '''
+    Compile a library with one function and a library with *func_count*
+    functions of *profile* in *work_path*. Return the median compile
+    times and the time per function, which is their difference divided
+    by the number of added functions so the fixed cost of a TU isn't
+    part of it.
+    '''
+    medians = {}
+    for count in (1, func_count):
+        name = '{0}{1}'.format(profile, count)
+        lib = Library(path=os.path.join(work_path, name, 'L000'),
+                      func_range=range(1, count + 1),
+                      body_profile=profile, body_size=body_size, seed=seed,
+                      lang=lang)
+        lib.create(FileWriter(work_path))
+        source = os.path.join(lib.getLibPath(), lib.getSources()[0])
+        cmd = [cc] + (cflags or []) + [
+            '-c', source, '-I', os.path.join(lib.getLibPath(), 'include'),
+            '-o', os.path.splitext(source)[0] + '.o']
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            p = subprocess.run(cmd, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+            times.append(time.perf_counter() - start)
+            if p.returncode != 0:
+                raise RuntimeError('{0} failed:\n{1}'.format(
+                    ' '.join(cmd), p.stdout.decode(errors='replace')))
+        medians[count] = statistics.median(times)
+
+    per_function = max(0.0, medians[func_count] - medians[1]) / (func_count - 1)
+    return {
+        'profile': profile,
+        'body_size': body_size,
+        'functions': func_count,
+        'tu_seconds': medians[1],
+        'seconds': medians[func_count],
+        'ms_per_function': per_function * 1000,
+    }
+
+
+def render_calibration(results, target=None):
+    '''
+    Render the results of calibrate() as a table, with *target* the
+    number of functions compiled in that many seconds is added.
+    '''
+    def row(cells):
+        return ' {0:<10}|{1}\n'.format(
+            cells[0], ''.join(' {0:<14}|'.format(cell) for cell in cells[1:]))
+
+    header = ['Profile', 'TU overhead', 'Sample', 'ms/function']
+    if target is not None:
+        header.append('Functions')
+    rule = ' ' + '-' * (11 + 16 * (len(header) - 1)) + '\n'
+    out = [rule, row(header), rule]
+    for result in results:
+        cells = [result['profile'],
+                 format_duration(result['tu_seconds']),
+                 format_duration(result['seconds']),
+                 '{0:.3f}'.format(result['ms_per_function'])]
+        if target is not None:
+            per_function = result['ms_per_function']
+            cells.append(int(target * 1000 / per_function)
+                         if per_function > 0 else '')
+        out.append(row(cells))
+    out.append(rule)
+    return ''.join(out)
+
+
+def calibrate_main(args):
+    '''
+    The calibrate subcommand
+    '''
+    options = calibrate_parser.parse_args(args)
+
+    profiles = options.profiles.split(',')
+    for profile in profiles:
+        if profile not in body_profiles[:-1]:
+            print("calibrate: unknown profile '{0}' must be one of {1}".format(
+                profile, ', '.join(body_profiles[:-1])))
+            return 1
+
+    if options.functions < 2 or options.repeat < 1 or options.body_size < 1:
+        print('calibrate: functions must be >= 2, repeat and body-size >= 1')
+        return 1
+
+    lang = languages[options.lang]
+    cc = options.cc or os.environ.get(lang['cc_var'], lang['cc'])
+    cflags = options.cflags
+    if cflags is None:
+        cflags = os.environ.get(lang['flags_var'], '')
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='gen_srcs_calibrate') as work_path:
+        for profile in profiles:
+            try:
+                results.append(calibrate(work_path, profile, options.functions,
+                                         body_size=options.body_size,
+                                         cc=cc, cflags=cflags.split(),
+                                         repeat=options.repeat,
+                                         seed=options.seed,
+                                         lang=options.lang))
+            except (OSError, RuntimeError) as e:
+                print('calibrate: {0}'.format(e))
+                return 1
+
+    if options.json_path:
+        with open(options.json_path, 'w') as f:
+            json.dump({'lang': options.lang, 'cc': cc, 'cflags': cflags,
+                       'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    sys.stdout.write(render_calibration(results, options.target))
+    return 0
+
+
+def template(path):
+    ''' Returns the path for the template at the specified *path*.
+    The *path* must be relative to the `templates/` directory in this
+    project. '''
+
+    if os.path.isabs(path):
+        raise ValueError('expected relative path')
+    return os.path.join(os.path.dirname(__file__), 'templates', path)
+
+
+def main(args):
+    '''
+    Main program
+    '''
+    if sys.version_info < (3, 4):
         print('Need python 3.4+ current version is %s' % sys.version)
         sys.exit(1)
 
+    if len(args) > 1 and args[1] == 'bench':
+        return bench_main(args[2:])
+    if len(args) > 1 and args[1] == 'edit':
+        return edit_main(args[2:])
+    if len(args) > 1 and args[1] == 'calibrate':
+        return calibrate_main(args[2:])
+    if len(args) > 1 and args[1] == 'measure':
+        return measure_main(args[2:])
+    if len(args) > 1 and args[1] == 'compare':
+        return compare_main(args[2:])
+
     options = parser.parse_args(args[1:])
     hierarchy_path = options.hierarchy_path
     library_count = options.library_count
@@ -664,18 +4610,204 @@ def main(args):
         print('Version %s' % version)
         return 0
 
-    builders = {'cmake': CMakeBuilder(), 'meson': MesonBuilder(),
-                'craftr': CraftrBuilder()}
     try:
-        builder = builders[options.builder[0]]
-    except:
-        print("option builder is '{0}' must be 'cmake', "
-              "'craftr' or 'meson'".format(options.builder))
+        builder = builders[options.builder[0]]()
+    except KeyError:
+        print("option builder is '{0}' must be one of {1}".format(
+            options.builder[0], ', '.join(sorted(builders))))
+        return 1
+
+    if options.jobs < 1:
+        print("option jobs is '{0}' must be >= 1".format(options.jobs))
+        return 1
+
+    if options.writer_threads < 0:
+        print("option writer-threads is '{0}' must be >= 0".format(
+            options.writer_threads))
+        return 1
+
+    if options.files_per_library < 1:
+        print("option files-per-library is '{0}' must be >= 1".format(
+            options.files_per_library))
+        return 1
+
+    if options.app_count < 1 or not 0 < options.app_fraction <= 1:
+        print('option app-count must be >= 1 and app-fraction in (0, 1]')
+        return 1
+
+    if options.fanout == 1 or options.fanout < 0:
+        print("option fanout is '{0}' must be 0 or >= 2".format(
+            options.fanout))
+        return 1
+
+    if ((options.linkage != 'static' or options.unity) and
+            options.builder[0] not in ('cmake', 'craftr', 'meson')):
+        print('option linkage and unity are supported by the cmake, craftr '
+              'and meson builders')
+        return 1
+
+    if options.include_depth < 0:
+        print("option include-depth is '{0}' must be >= 0".format(
+            options.include_depth))
+        return 1
+
+    if options.body_size < 1:
+        print("option body-size is '{0}' must be >= 1".format(
+            options.body_size))
         return 1
 
-    hierarchy = Hierarchy(hierarchy_path[0], library_count[0],
-                          function_count_per_library[0], builder)
-    hierarchy.create()
+    if options.dep_fanout < 1 or options.max_in_degree < 0:
+        print('option dep-fanout must be >= 1 and max-in-degree >= 0')
+        return 1
+
+    churn = {}
+    for category in ('bodies', 'headers', 'libraries'):
+        percent = getattr(options, 'churn_' + category)
+        if not 0 <= percent <= 100:
+            print("option churn-{0} is '{1}' must be between 0 and 100".format(
+                category, percent))
+            return 1
+        if percent:
+            churn[category] = percent
+    if churn:
+        churn['seed'] = options.churn_seed
+
+    if options.verify and (options.shard or options.archive):
+        print('option verify can not be used with shard or archive')
+        return 1
+
+    if options.app_shards < 0:
+        print("option app-shards is '{0}' must be >= 0".format(
+            options.app_shards))
+        return 1
+
+    def make_hierarchy(builder):
+        return Hierarchy(hierarchy_path[0], library_count[0],
+                         function_count_per_library[0], builder,
+                         jobs=options.jobs,
+                         writer_threads=options.writer_threads,
+                         force=options.force, fsync=options.fsync,
+                         app_shards=options.app_shards,
+                         files_per_lib=options.files_per_library,
+                         internal_header=options.internal_header,
+                         app_count=options.app_count,
+                         app_select=options.app_select,
+                         app_fraction=options.app_fraction,
+                         topology=options.topology,
+                         dep_fanout=options.dep_fanout,
+                         max_in_degree=options.max_in_degree,
+                         fanout=options.fanout,
+                         body_profile=options.body_profile,
+                         body_size=options.body_size,
+                         lang=options.lang,
+                         include_depth=options.include_depth,
+                         linkage=options.linkage,
+                         unity=options.unity,
+                         seed=options.seed,
+                         shard=options.shard,
+                         churn=churn)
+
+    # Keep stdout for the archive when it is written there
+    out = sys.stderr if options.archive == '-' else sys.stdout
+
+    # Plan the hierarchy with a builder of its own before anything
+    # is written
+    if (options.plan or options.max_bytes is not None or
+            options.max_files is not None):
+        manifest_name = None
+        if options.shard and options.shard[1] > 1:
+            manifest_name = FileWriter.SHARD_MANIFEST_NAME.format(
+                *options.shard)
+        planner = make_hierarchy(builders[options.builder[0]]()).create(
+            PlanWriter(hierarchy_path[0], manifest_name))
+        plan = planner.plan()
+        if options.plan:
+            summary = json.dumps(plan, indent=2, sort_keys=True)
+            if options.plan == '-':
+                print(summary, file=out)
+            else:
+                with open(options.plan, 'w') as f:
+                    f.write(summary + '\n')
+            return 0
+        if options.max_bytes is not None and plan['bytes'] > options.max_bytes:
+            print('the hierarchy has {0} bytes, more than max-bytes {1}'.format(
+                plan['bytes'], options.max_bytes), file=out)
+            return 1
+        if options.max_files is not None and plan['files'] > options.max_files:
+            print('the hierarchy has {0} files, more than max-files {1}'.format(
+                plan['files'], options.max_files), file=out)
+            return 1
+
+    # Open the database first so a bad path fails before anything
+    # is written
+    store = None
+    if options.db:
+        try:
+            store = ResultsStore(options.db)
+        except RuntimeError as e:
+            print('db: {0}'.format(e), file=out)
+            return 1
+
+    hierarchy = make_hierarchy(builder)
+    writer = None
+    if options.archive:
+        writer = TarWriter(hierarchy_path[0], options.archive,
+                           compression=options.compression,
+                           mtime=os.environ.get('SOURCE_DATE_EPOCH'))
+    elif options.verify:
+        writer = VerifyWriter(hierarchy_path[0])
+
+    if options.pstats:
+        import cProfile
+        profiler = cProfile.Profile()
+        writer = profiler.runcall(hierarchy.create, writer)
+        profiler.dump_stats(options.pstats)
+    else:
+        writer = hierarchy.create(writer)
+    print(writer.summary(), file=out)
+    if options.verify and not writer.ok():
+        for kind in ('missing', 'different', 'extra'):
+            for rel_path in getattr(writer, kind):
+                print('{0}: {1}'.format(kind, rel_path), file=out)
+        if store is not None:
+            store.close()
+        return 1
+
+    if options.churn_report:
+        report = json.dumps({
+            'churn': churn,
+            'translation_units': hierarchy.unit_count,
+            'changed': hierarchy.churn_units,
+        }, indent=2, sort_keys=True)
+        if options.churn_report == '-':
+            print(report, file=out)
+        else:
+            with open(options.churn_report, 'w') as f:
+                f.write(report + '\n')
+
+    if store is not None:
+        params = hierarchy.params()
+        params['jobs'] = hierarchy.jobs
+        params['writer_threads'] = hierarchy.writer_threads
+        phases = {phase['name']: [phase['wall']]
+                  for phase in hierarchy.profile.phases}
+        phases['total'] = [sum(phase['wall'] for phase in
+                               hierarchy.profile.phases)]
+        store.add_run('generate', params, {params['builder']: phases},
+                      versions={'gen_srcs': version})
+        store.close()
+
+    if options.profile:
+        summary = hierarchy.profile.as_json(writer)
+        summary['params'] = hierarchy.params()
+        summary['params']['jobs'] = hierarchy.jobs
+        summary['params']['writer_threads'] = hierarchy.writer_threads
+        summary = json.dumps(summary, indent=2, sort_keys=True)
+        if options.profile == '-':
+            print(summary, file=out)
+        else:
+            with open(options.profile, 'w') as f:
+                f.write(summary + '\n')
     return 0
 
 